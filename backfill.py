@@ -0,0 +1,324 @@
+"""
+Offline backfill: runs TrafficDetector over an archive of clips on every core.
+
+Clips come either from a directory (captured as video_<unix time>.avi by the
+capture server) or from a JSON-lines manifest whose entries look like the
+X-Video-Metadata header served by /videos plus a "video_path". Camera geometry
+is read from a JSON file in the format returned by GET /cams.
+
+Results are written in batches to SQLite or CSV. Clips already present in the
+output are skipped, so an interrupted backfill resumes where it stopped.
+
+With --save-detections DIR the tracked detections of every clip are kept as
+DIR/<clip>.npy. After a camera's lines or ref_distance change, --replay DIR
+recounts those clips from the saved detections without loading the model.
+The input may then be the detections directory itself (such as the one the
+live workers fill, see DETECTIONS_FOLDER in main.py): each file's sidecar
+identifies its clip, so the videos need not exist any more.
+
+Example:
+    python backfill.py archive/ --cams cams.json --cam-id 2 --output backfill.sqlite
+    python backfill.py archive/ --cams cams.json --cam-id 2 --replay detections/ --output recount.sqlite
+    python backfill.py detections/ --cams cams.json --replay detections/ --output recount.sqlite
+"""
+import argparse
+import concurrent.futures
+import csv
+import json
+import multiprocessing
+import os
+import re
+import sqlite3
+import time
+
+import cv2
+
+from detection_cache import detections_file, metadata_path
+from models import Video, Resolution
+
+VIDEO_EXTENSIONS = (".avi", ".mp4", ".mkv", ".mov")
+CSV_FIELDS = ["video_path", "traffic_cam_id", "start_datetime", "end_datetime", "vehicle_count",
+              "average_speed", "zones", "elapsed", "error"]
+
+# Per-process state, set up once by _init_worker.
+_model = None
+_settings = None
+_geometry_cache = None
+
+
+def _init_worker(model_path: str, threads: int, settings: dict):
+    global _model, _settings, _geometry_cache
+    import torch
+    from ai_model import AIModelFactory
+    from geometry import GeometryCache
+
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
+    _model = None if settings.get("replay") else AIModelFactory.create_model("yolo", model_path)
+    _settings = settings
+    _geometry_cache = GeometryCache()
+
+
+def clip_duration(video_path: str) -> float:
+    cap = cv2.VideoCapture(video_path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        return frames / fps if fps > 0 else 0.0
+    finally:
+        cap.release()
+
+
+def _process_clip(entry: dict) -> dict:
+    from traffic_detector import TrafficDetector
+    from trackers import create_tracker, reset_builtin_tracker
+
+    row = {"video_path": entry["video_path"], "traffic_cam_id": entry.get("traffic_cam_id")}
+    started = time.perf_counter()
+    try:
+        if entry.get("end_time") is None:
+            entry = dict(entry, end_time=entry["start_time"] + clip_duration(entry["video_path"]))
+        video_obj = Video.from_json(entry)
+        detections_dir = _settings.get("detections_dir")
+        detections_path = detections_file(detections_dir, entry["video_filename"]) if detections_dir else None
+        if _model is not None:
+            reset_builtin_tracker(_model)
+        detector = TrafficDetector(
+            video_path=video_obj.video_path,
+            model=_model,
+            start_ref_line=video_obj.start_ref_line,
+            finish_ref_line=video_obj.finish_ref_line,
+            ref_distance=video_obj.ref_distance,
+            track_orientation=video_obj.track_orientation,
+            zones=video_obj.zones,
+            tracker=create_tracker(_settings["tracker"]),
+            show_video=False,
+            vehicle_classes=_settings["vehicle_classes"],
+            frame_skip=_settings["frame_skip"],
+            target_width=_settings["target_width"],
+            target_height=_settings["target_height"],
+            geometry=_geometry_cache.get(video_obj, _settings["target_width"], _settings["target_height"]),
+            detections_path=None if _settings.get("replay") else detections_path
+        )
+        if _settings.get("replay"):
+            result = detector.replay(detections_path)
+        else:
+            result = detector.process_video()
+        row.update({
+            "start_datetime": video_obj.start_datetime.isoformat(),
+            "end_datetime": video_obj.end_datetime.isoformat(),
+            "vehicle_count": result["vehicle_count"],
+            "average_speed": float(result["average_speed"]),
+            "zones": json.dumps(result.get("zones", {})),
+            "events": result["events"].to_bytes(video_obj.traffic_cam_id, video_obj.start_datetime),
+            "error": None
+        })
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    row["elapsed"] = time.perf_counter() - started
+    return row
+
+
+def load_cams(path: str) -> dict:
+    """Reads camera geometry in the GET /cams format, keyed by traffic_cam_id."""
+    with open(path) as f:
+        return {int(cam["traffic_cam_id"]): cam for cam in json.load(f)}
+
+
+def iter_entries(source: str, cams: dict, cam_id: int = None):
+    """
+    Yields clip metadata dicts ready for Video.from_json, with camera geometry merged in.
+    """
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if name.endswith(".npy"):
+                entry = _recorded_entry(os.path.join(source, name), cam_id)
+                if entry is not None:
+                    yield _with_geometry(entry, cams)
+                continue
+            if not name.lower().endswith(VIDEO_EXTENSIONS):
+                continue
+            path = os.path.join(source, name)
+            match = re.search(r"(\d{9,})", name)
+            start_time = float(match.group(1)) if match else os.path.getmtime(path)
+            entry = {"video_path": path, "video_filename": name, "start_time": start_time,
+                     "end_time": None, "traffic_cam_id": cam_id}
+            yield _with_geometry(entry, cams)
+    else:
+        with open(source) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    entry.setdefault("video_filename", os.path.basename(entry["video_path"]))
+                    entry.setdefault("end_time", None)
+                    if cam_id is not None:
+                        entry.setdefault("traffic_cam_id", cam_id)
+                    yield _with_geometry(entry, cams)
+
+
+def _recorded_entry(detections_path: str, cam_id: int = None):
+    """Clip metadata saved alongside recorded detections, or None if the sidecar has none."""
+    try:
+        with open(metadata_path(detections_path)) as f:
+            clip = json.load(f).get("clip")
+    except FileNotFoundError:
+        return None
+    if not clip:
+        return None
+    entry = dict(clip, video_path=os.path.join(os.path.dirname(detections_path), clip["video_filename"]))
+    if cam_id is not None:
+        entry.setdefault("traffic_cam_id", cam_id)
+    return entry
+
+
+def _with_geometry(entry: dict, cams: dict) -> dict:
+    if "start_ref_line" in entry:
+        return entry
+    cam = cams.get(entry.get("traffic_cam_id"))
+    if cam is None:
+        raise ValueError(f"No geometry for camera {entry.get('traffic_cam_id')} ({entry['video_path']})")
+    merged = {k: cam[k] for k in ("start_ref_line", "finish_ref_line", "ref_distance", "track_orientation", "zones",
+                                  "roi", "homography", "config_version") if k in cam}
+    merged.update(entry)
+    return merged
+
+
+class ResultWriter:
+    """Buffers result rows and writes them in bulk to SQLite or CSV."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.is_sqlite = not path.lower().endswith(".csv")
+        self.buffer = []
+        if self.is_sqlite:
+            self.db = sqlite3.connect(path)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " video_path TEXT PRIMARY KEY, traffic_cam_id INTEGER, start_datetime TEXT, end_datetime TEXT,"
+                " vehicle_count INTEGER, average_speed REAL, zones TEXT, events BLOB, elapsed REAL, error TEXT)"
+            )
+            self.db.commit()
+
+    def done(self) -> set:
+        """Paths of clips already processed successfully."""
+        if self.is_sqlite:
+            return {path for path, in self.db.execute("SELECT video_path FROM results WHERE error IS NULL")}
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path, newline="") as f:
+            return {row["video_path"] for row in csv.DictReader(f) if not row["error"]}
+
+    def add(self, row: dict):
+        self.buffer.append(row)
+
+    def flush(self):
+        if not self.buffer:
+            return
+        if self.is_sqlite:
+            columns = CSV_FIELDS + ["events"]
+            self.db.executemany(
+                f"INSERT OR REPLACE INTO results ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [tuple(row.get(c) for c in columns) for row in self.buffer]
+            )
+            self.db.commit()
+        else:
+            new_file = not os.path.exists(self.path)
+            with open(self.path, "a", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+                if new_file:
+                    writer.writeheader()
+                writer.writerows(self.buffer)
+        self.buffer.clear()
+
+    def close(self):
+        self.flush()
+        if self.is_sqlite:
+            self.db.close()
+
+
+def run_backfill(entries: list, writer: ResultWriter, workers: int, threads: int, model_path: str,
+                 settings: dict, batch_size: int = 50):
+    total = len(entries)
+    processed = failed = 0
+    started = time.time()
+    ctx = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                                                initargs=(model_path, threads, settings)) as executor:
+        pending = set()
+        queue = iter(entries)
+        while True:
+            # keep a bounded number of clips in flight
+            for entry in queue:
+                pending.add(executor.submit(_process_clip, entry))
+                if len(pending) >= workers * 2:
+                    break
+            if not pending:
+                break
+            completed, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in completed:
+                row = future.result()
+                writer.add(row)
+                processed += 1
+                if row["error"]:
+                    failed += 1
+                    print(f"Backfill: {row['video_path']} failed: {row['error']}")
+            if len(writer.buffer) >= batch_size or not pending:
+                writer.flush()
+                elapsed = time.time() - started
+                rate = processed / elapsed * 3600 if elapsed > 0 else 0.0
+                eta = (total - processed) / rate * 3600 if rate > 0 else 0.0
+                print(f"Backfill: {processed}/{total} clips ({failed} failed), "
+                      f"{rate:.0f} clips/hour, ETA {eta / 60:.1f} min")
+    writer.flush()
+    return processed, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process an archive of clips with TrafficDetector on all cores")
+    parser.add_argument("input", help="Directory of clips or JSON-lines manifest")
+    parser.add_argument("--cams", help="Camera geometry JSON (as returned by GET /cams)")
+    parser.add_argument("--cam-id", type=int, help="traffic_cam_id for clips that do not specify one")
+    parser.add_argument("--output", default="backfill.sqlite", help="Results file (.sqlite or .csv)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--threads", type=int, default=None, help="Torch/OpenCV threads per worker")
+    parser.add_argument("--model", default="yolo11n.pt")
+    parser.add_argument("--tracker", choices=["ultralytics", "iou"], default="ultralytics")
+    parser.add_argument("--frame-skip", type=int, default=1)
+    parser.add_argument("--width", type=int, default=Resolution.Default.width)
+    parser.add_argument("--height", type=int, default=Resolution.Default.height)
+    parser.add_argument("--batch-size", type=int, default=50, help="Rows per bulk write")
+    parser.add_argument("--save-detections", metavar="DIR", help="Also save each clip's tracked detections in DIR")
+    parser.add_argument("--replay", metavar="DIR", help="Recount from detections saved in DIR instead of running the model")
+    args = parser.parse_args()
+
+    cams = load_cams(args.cams) if args.cams else {}
+    writer = ResultWriter(args.output)
+    done = writer.done()
+    entries = [e for e in iter_entries(args.input, cams, args.cam_id) if e["video_path"] not in done]
+    print(f"Backfill: {len(entries)} clips to process ({len(done)} already done)")
+
+    threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+    settings = {
+        "vehicle_classes": {"car", "truck", "bus", "motorcycle", "van"},
+        "frame_skip": args.frame_skip,
+        "tracker": args.tracker,
+        "target_width": args.width,
+        "target_height": args.height,
+        "detections_dir": args.replay or args.save_detections,
+        "replay": args.replay is not None,
+    }
+    if settings["detections_dir"] and not args.replay:
+        os.makedirs(settings["detections_dir"], exist_ok=True)
+    started = time.time()
+    try:
+        processed, failed = run_backfill(entries, writer, args.workers, threads, args.model, settings,
+                                         args.batch_size)
+    finally:
+        writer.close()
+    hours = (time.time() - started) / 3600
+    rate = processed / hours if hours > 0 else 0.0
+    print(f"Backfill: finished {processed} clips ({failed} failed) in {hours * 60:.1f} min, {rate:.0f} clips/hour")
+
+
+if __name__ == "__main__":
+    main()
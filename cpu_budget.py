@@ -0,0 +1,195 @@
+"""
+CPU budgeting for the video workers.
+
+torch and OpenCV each size their thread pools to every core by default, so N
+workers processing clips at once run N times too many threads and contend for
+the same cores. CpuPlan splits a core budget into threads_per_worker for each
+worker; CpuBudget applies it to the executor threads that run the detectors,
+optionally pinning each of them (and the threads it spawns) to its own cores.
+
+autotune() benchmarks the worker x threads-per-worker splits of the budget on
+a representative clip and returns the one with the highest clips per minute:
+    python cpu_budget.py sample.avi --budget 8
+"""
+import argparse
+import concurrent.futures
+import itertools
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+import cv2
+
+
+def available_cores() -> List[int]:
+    """Cores this process may run on (respects taskset/cgroup affinity where supported)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+@dataclass
+class CpuPlan:
+    """
+    How a CPU budget is split across workers.
+
+    Attributes:
+        num_workers: Clips processed concurrently.
+        threads_per_worker: torch intra-op, OpenCV and decoder threads per worker.
+        core_sets: Cores each executor thread is pinned to, or None to leave scheduling to the OS.
+    """
+    num_workers: int
+    threads_per_worker: int
+    core_sets: Optional[List[List[int]]] = None
+
+    @classmethod
+    def split(cls, num_workers: int, cpu_budget: int = None, threads_per_worker: int = None,
+              pin_cores: bool = False) -> "CpuPlan":
+        """
+        Args:
+            num_workers: Number of workers.
+            cpu_budget: Cores to use in total; defaults to every available core.
+            threads_per_worker: Overrides cpu_budget // num_workers.
+            pin_cores: Give each worker a disjoint slice of the budgeted cores.
+        """
+        cores = available_cores()
+        budget = min(cpu_budget or len(cores), len(cores))
+        threads = threads_per_worker or max(1, budget // num_workers)
+        core_sets = None
+        if pin_cores:
+            # wrap around when workers x threads exceeds the cores, rather than leave workers unpinned
+            core_sets = [[cores[(w * threads + t) % budget] for t in range(threads)] for w in range(num_workers)]
+        return cls(num_workers=num_workers, threads_per_worker=threads, core_sets=core_sets)
+
+
+class CpuBudget:
+    """
+    Applies a CpuPlan to a ThreadPoolExecutor.
+
+    torch.set_num_threads and cv2.setNumThreads are process-wide, so they are set
+    to threads_per_worker once; with num_workers clips in flight the total stays
+    within the budget. Pinning is per thread: each executor thread takes the next
+    core set when it starts, and the intra-op threads it spawns inherit it.
+
+    Attributes:
+        plan: The CpuPlan being applied.
+    """
+
+    def __init__(self, plan: CpuPlan):
+        self.plan = plan
+        self._next_slot = itertools.count()
+        self._lock = threading.Lock()
+
+    def apply_process_wide(self):
+        import torch
+
+        torch.set_num_threads(self.plan.threads_per_worker)
+        cv2.setNumThreads(self.plan.threads_per_worker)
+
+    def initialize_thread(self):
+        """ThreadPoolExecutor initializer: pins the calling thread to its core set."""
+        if not self.plan.core_sets or not hasattr(os, "sched_setaffinity"):
+            return
+        with self._lock:
+            slot = next(self._next_slot)
+        cores = self.plan.core_sets[slot % len(self.plan.core_sets)]
+        # pid 0 is the calling thread on Linux
+        os.sched_setaffinity(0, cores)
+
+    def executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        self.apply_process_wide()
+        return concurrent.futures.ThreadPoolExecutor(max_workers=self.plan.num_workers,
+                                                     initializer=self.initialize_thread)
+
+
+def candidate_splits(cpu_budget: int) -> List[tuple]:
+    """(num_workers, threads_per_worker) pairs that use as much of the budget as possible, e.g. 8x1, 4x2, 2x4, 1x8."""
+    splits = set()
+    for threads in range(1, cpu_budget + 1):
+        num_workers = cpu_budget // threads
+        if cpu_budget // num_workers == threads:
+            splits.add((num_workers, threads))
+    return sorted(splits, reverse=True)
+
+
+def _benchmark_clip(video_path: str, model, threads: int):
+    from models import Line, Resolution
+    from traffic_detector import TrafficDetector
+    from trackers import reset_builtin_tracker
+
+    reset_builtin_tracker(model)
+    width, height = Resolution.Default.value
+    detector = TrafficDetector(
+        video_path=video_path,
+        model=model,
+        start_ref_line=Line(0, height / 3, width, height / 3),
+        finish_ref_line=Line(0, 2 * height / 3, width, 2 * height / 3),
+        ref_distance=10,
+        track_orientation="vertical",
+        vehicle_classes={"car", "truck", "bus", "motorcycle", "van"},
+        target_width=width,
+        target_height=height,
+        decoder_threads=threads
+    )
+    detector.process_video()
+
+
+def measure_split(video_path: str, model_path: str, num_workers: int, threads_per_worker: int,
+                  clips_per_worker: int = 2, pin_cores: bool = False) -> dict:
+    """
+    Processes clips_per_worker copies of the sample clip on each of num_workers workers.
+
+    Returns:
+        A dict with the split, the elapsed seconds and the clips per minute.
+    """
+    from ai_model import AIModelFactory
+
+    plan = CpuPlan.split(num_workers, num_workers * threads_per_worker, threads_per_worker, pin_cores)
+    budget = CpuBudget(plan)
+    models = [AIModelFactory.create_model("yolo", model_path) for _ in range(num_workers)]
+    with budget.executor() as executor:
+        # each worker processes its clips back to back, as video_worker does
+        started = time.perf_counter()
+        list(executor.map(lambda m: [_benchmark_clip(video_path, m, threads_per_worker)
+                                     for _ in range(clips_per_worker)], models))
+        elapsed = time.perf_counter() - started
+    clips = num_workers * clips_per_worker
+    return {"num_workers": num_workers, "threads_per_worker": threads_per_worker, "elapsed": elapsed,
+            "clips_per_minute": clips / elapsed * 60 if elapsed > 0 else 0.0}
+
+
+def autotune(video_path: str, model_path: str = "yolo11n.pt", cpu_budget: int = None,
+             clips_per_worker: int = 2, pin_cores: bool = False, verbose: bool = True) -> CpuPlan:
+    """
+    Benchmarks every split of the budget on this machine and returns the fastest as a CpuPlan.
+    """
+    budget = min(cpu_budget or len(available_cores()), len(available_cores()))
+    best = None
+    for num_workers, threads in candidate_splits(budget):
+        run = measure_split(video_path, model_path, num_workers, threads, clips_per_worker, pin_cores)
+        if verbose:
+            print(f"CpuBudget: {num_workers} workers x {threads} threads: "
+                  f"{run['clips_per_minute']:.1f} clips/min")
+        if best is None or run["clips_per_minute"] > best["clips_per_minute"]:
+            best = run
+    return CpuPlan.split(best["num_workers"], budget, best["threads_per_worker"], pin_cores)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the workers x threads-per-worker split with the best throughput")
+    parser.add_argument("video_path", help="Representative sample clip")
+    parser.add_argument("--model", default="yolo11n.pt")
+    parser.add_argument("--budget", type=int, default=None, help="Cores to use, default all available")
+    parser.add_argument("--clips-per-worker", type=int, default=2)
+    parser.add_argument("--pin-cores", action="store_true")
+    args = parser.parse_args()
+
+    plan = autotune(args.video_path, args.model, args.budget, args.clips_per_worker, args.pin_cores)
+    print(f"Best: VideoProcessor(num_workers={plan.num_workers}, threads_per_worker={plan.threads_per_worker}"
+          f"{', pin_cores=True' if args.pin_cores else ''})")
+
+
+if __name__ == "__main__":
+    main()
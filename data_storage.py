@@ -1,24 +1,45 @@
 import aiohttp
 import time
+from event_log import CrossingEventLog
 from models import Video
 
 DATA_SERVER_REGISTER_ENDPOINT_URL = "https://insect-promoted-gnu.ngrok-free.app/record"
+DATA_SERVER_EVENTS_ENDPOINT_URL = "https://insect-promoted-gnu.ngrok-free.app/events"
 
 
-async def send_to_data_server(video_obj: Video, result: dict):
+async def send_to_data_server(video_obj: Video, result: dict) -> bool:
     payload = {
         "traffic_cam_id": video_obj.traffic_cam_id,
         "start_datetime": video_obj.start_datetime.isoformat(),
         "end_datetime": video_obj.end_datetime.isoformat(),
         "vehicle_count": result.get("vehicle_count"),
-        "average_speed": float(result.get("average_speed", 0))
+        "average_speed": float(result.get("average_speed", 0)),
+        "status": result.get("status", "processed")
     }
     try:
         async with aiohttp.ClientSession() as session:
             async with session.post(DATA_SERVER_REGISTER_ENDPOINT_URL, json=payload) as resp:
                 if resp.status == 200:
                     print(f"[{time.strftime('%X')}] Successfully sent data: {payload}")
-                else:
-                    print(f"[{time.strftime('%X')}] Failed to send data, status: {resp.status}")
+                    return True
+                print(f"[{time.strftime('%X')}] Failed to send data, status: {resp.status}")
     except Exception as e:
-        print(f"Exception sending data to server: {e}")
\ No newline at end of file
+        print(f"Exception sending data to server: {e}")
+    return False
+
+
+async def send_events_to_data_server(video_obj: Video, events: CrossingEventLog) -> bool:
+    if not len(events):
+        return True
+    body = events.to_bytes(video_obj.traffic_cam_id, video_obj.start_datetime)
+    headers = {"Content-Type": "application/octet-stream"}
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.post(DATA_SERVER_EVENTS_ENDPOINT_URL, data=body, headers=headers) as resp:
+                if resp.status == 200:
+                    print(f"[{time.strftime('%X')}] Successfully sent {len(events)} events ({len(body)} bytes)")
+                    return True
+                print(f"[{time.strftime('%X')}] Failed to send events, status: {resp.status}")
+    except Exception as e:
+        print(f"Exception sending events to server: {e}")
+    return False
@@ -0,0 +1,202 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+# One row per tracked detection; packed so a clip's file can be memory-mapped with np.load(mmap_mode="r").
+DETECTION_DTYPE = np.dtype([
+    ("frame", "<i4"),
+    ("track_id", "<i4"),
+    ("class_id", "<i2"),
+    ("cx", "<f4"),
+    ("cy", "<f4"),
+    ("w", "<f4"),
+    ("h", "<f4"),
+])
+
+
+def metadata_path(detections_path: str) -> str:
+    return detections_path + ".json"
+
+
+def detections_file(directory: str, video_filename: str) -> str:
+    """Where the detections of a clip are kept: <directory>/<clip name>.npy."""
+    return os.path.join(directory, os.path.splitext(os.path.basename(video_filename))[0] + ".npy")
+
+
+class DetectionRecorder:
+    """
+    Collects the tracked detections of a clip and saves them as a .npy file plus a JSON sidecar.
+
+    Attributes:
+        path: Destination .npy file.
+        clip: Optional clip metadata (video_filename, traffic_cam_id, start_time, end_time)
+            stored in the sidecar, so the clip can be recounted after the video is gone.
+    """
+
+    def __init__(self, path: str, clip: dict = None):
+        self.path = path
+        self.clip = clip
+        self._chunks = []
+
+    def add(self, frame_id: int, boxes, ids: list, classes: list):
+        """
+        Args:
+            frame_id: Index of the frame in the source video.
+            boxes: (N, 4) boxes as center_x, center_y, w, h.
+            ids: Track ids.
+            classes: Class ids.
+        """
+        if not len(ids):
+            return
+        chunk = np.empty(len(ids), dtype=DETECTION_DTYPE)
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        chunk["frame"] = frame_id
+        chunk["track_id"] = ids
+        chunk["class_id"] = classes
+        chunk["cx"], chunk["cy"], chunk["w"], chunk["h"] = boxes.T
+        self._chunks.append(chunk)
+
+    def save(self, fps: float, frame_size: tuple, frame_skip: int, class_names: dict):
+        rows = np.concatenate(self._chunks) if self._chunks else np.empty(0, dtype=DETECTION_DTYPE)
+        np.save(self.path, rows)
+        with open(metadata_path(self.path), "w") as f:
+            json.dump({
+                "fps": fps,
+                "frame_size": list(frame_size),
+                "frame_skip": frame_skip,
+                "class_names": {str(k): v for k, v in class_names.items()},
+                "detections": len(rows),
+                "clip": self.clip,
+            }, f)
+
+
+def load_detections(path: str) -> tuple:
+    """
+    Memory-maps a recorded clip.
+
+    Returns:
+        A (rows, metadata) tuple; rows is a read-only structured array sorted by frame.
+    """
+    rows = np.load(path, mmap_mode="r")
+    with open(metadata_path(path)) as f:
+        metadata = json.load(f)
+    metadata["class_names"] = {int(k): v for k, v in metadata["class_names"].items()}
+    return rows, metadata
+
+
+def iter_frames(rows: np.ndarray):
+    """
+    Yields (frame_id, boxes as center_x, center_y, w, h, track ids, class ids) per recorded frame.
+    """
+    if not len(rows):
+        return
+    frames = rows["frame"]
+    bounds = np.flatnonzero(np.diff(frames)) + 1
+    starts = np.concatenate([[0], bounds])
+    ends = np.concatenate([bounds, [len(rows)]])
+    boxes = np.column_stack([rows["cx"], rows["cy"], rows["w"], rows["h"]])
+    track_ids = rows["track_id"].tolist()
+    class_ids = rows["class_id"].tolist()
+    for start, end in zip(starts, ends):
+        yield int(frames[start]), boxes[start:end], track_ids[start:end], class_ids[start:end]
+
+
+class DetectionStore:
+    """
+    Size- and age-bounded directory of recorded detections, one .npy file (plus
+    sidecar) per processed clip, kept after the clip itself has been deleted.
+
+    Like VideoSpool, files are tracked in a small SQLite index inside the
+    directory with a running total, so retention never rescans the directory.
+    Safe to use from several executor threads.
+
+    Attributes:
+        directory: Directory holding the detection files.
+        max_bytes: Total size budget in bytes, or None for no size limit.
+        max_age: Maximum file age in seconds, or None for no age limit.
+    """
+
+    INDEX_FILENAME = ".detections.sqlite"
+
+    def __init__(self, directory: str, max_bytes: Optional[int] = None, max_age: Optional[float] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, self.INDEX_FILENAME), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS detections (path TEXT PRIMARY KEY, size INTEGER NOT NULL, added REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS detections_added ON detections (added)")
+        self._db.commit()
+        self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM detections").fetchone()[0]
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total
+
+    def path_for(self, video_filename: str) -> str:
+        return detections_file(self.directory, video_filename)
+
+    def add(self, path: str) -> list:
+        """
+        Registers a recorded clip and enforces the budget. Missing files (e.g. the clip's
+        result came from the result cache, so nothing was recorded) are ignored.
+
+        Returns:
+            The .npy paths evicted to make room.
+        """
+        try:
+            size = os.path.getsize(path) + os.path.getsize(metadata_path(path))
+        except FileNotFoundError:
+            return []
+        with self._lock:
+            row = self._db.execute("SELECT size FROM detections WHERE path = ?", (path,)).fetchone()
+            if row:
+                self._total -= row[0]
+            self._db.execute("INSERT OR REPLACE INTO detections (path, size, added) VALUES (?, ?, ?)",
+                             (path, size, time.time()))
+            self._db.commit()
+            self._total += size
+        return self.enforce(keep=path)
+
+    def enforce(self, keep: str = None) -> list:
+        """
+        Deletes expired files, then the oldest ones until the size budget is met.
+
+        Returns:
+            The deleted .npy paths.
+        """
+        evicted = []
+        with self._lock:
+            if self.max_age is not None:
+                rows = self._db.execute("SELECT path, size FROM detections WHERE added < ?",
+                                        (time.time() - self.max_age,)).fetchall()
+                evicted.extend(row for row in rows if row[0] != keep)
+            if self.max_bytes is not None:
+                excess = self._total - self.max_bytes - sum(size for _, size in evicted)
+                if excess > 0:
+                    expired = {path for path, _ in evicted}
+                    for path, size in self._db.execute("SELECT path, size FROM detections ORDER BY added"):
+                        if excess <= 0:
+                            break
+                        if path == keep or path in expired:
+                            continue
+                        evicted.append((path, size))
+                        excess -= size
+            for path, size in evicted:
+                self._db.execute("DELETE FROM detections WHERE path = ?", (path,))
+                self._total -= size
+                for doomed in (path, metadata_path(path)):
+                    try:
+                        os.remove(doomed)
+                    except FileNotFoundError:
+                        pass
+            self._db.commit()
+        return [path for path, _ in evicted]
@@ -0,0 +1,196 @@
+"""
+Accuracy-versus-cost evaluation of detector settings.
+
+Runs TrafficDetector over labeled clips for every combination of the given
+settings and reports, per configuration, the processing cost and the counting
+and speed errors against ground truth. Pareto-optimal configurations are
+marked, and for each camera the cheapest configuration that meets the
+accuracy targets is recommended.
+
+The manifest is JSON lines in the backfill.py format plus labels:
+    {"video_path": ..., "traffic_cam_id": 2, "start_time": ..., "gt_count": 14, "gt_average_speed": 38.5}
+
+Example:
+    python evaluate.py labeled.jsonl --cams cams.json --frame-skip 1 2 4 --resolution 320x240 640x360
+"""
+import argparse
+import csv
+import itertools
+import time
+from collections import defaultdict
+
+from backfill import load_cams, iter_entries, clip_duration
+from models import Video, Resolution
+
+VEHICLE_CLASSES = {"car", "truck", "bus", "motorcycle", "van"}
+GRID_KEYS = ("model", "tracker", "frame_skip", "resolution", "inference_size", "cooldown_duration")
+
+
+def run_clip(entry: dict, model, config: dict) -> dict:
+    from traffic_detector import TrafficDetector
+    from trackers import create_tracker, reset_builtin_tracker
+
+    if entry.get("end_time") is None:
+        entry = dict(entry, end_time=entry["start_time"] + clip_duration(entry["video_path"]))
+    video_obj = Video.from_json(entry)
+    reset_builtin_tracker(model)
+    width, height = config["resolution"]
+    detector = TrafficDetector(
+        video_path=video_obj.video_path,
+        model=model,
+        start_ref_line=video_obj.start_ref_line,
+        finish_ref_line=video_obj.finish_ref_line,
+        ref_distance=video_obj.ref_distance,
+        track_orientation=video_obj.track_orientation,
+        zones=video_obj.zones,
+        tracker=create_tracker(config["tracker"]),
+        cooldown_duration=config["cooldown_duration"],
+        vehicle_classes=VEHICLE_CLASSES,
+        frame_skip=config["frame_skip"],
+        target_width=width,
+        target_height=height,
+        inference_size=config["inference_size"]
+    )
+    started = time.perf_counter()
+    result = detector.process_video()
+    elapsed = time.perf_counter() - started
+    duration = (video_obj.end_datetime - video_obj.start_datetime).total_seconds()
+    return {"elapsed": elapsed, "duration": duration, "result": result}
+
+
+def summarize(runs: list) -> dict:
+    """
+    Aggregates (entry, clip run) pairs into cost and error metrics.
+    """
+    elapsed = sum(run["elapsed"] for _, run in runs)
+    duration = sum(run["duration"] for _, run in runs)
+    count_errors = [abs(run["result"]["vehicle_count"] - entry["gt_count"]) for entry, run in runs]
+    total_gt = sum(entry["gt_count"] for entry, _ in runs)
+    speed_errors = [abs(run["result"]["average_speed"] - entry["gt_average_speed"])
+                    for entry, run in runs if entry.get("gt_average_speed") is not None]
+    return {
+        "clips": len(runs),
+        "seconds_per_clip": elapsed / len(runs),
+        "clips_per_hour": len(runs) / elapsed * 3600 if elapsed > 0 else 0.0,
+        "realtime_factor": duration / elapsed if elapsed > 0 else 0.0,
+        "count_mae": sum(count_errors) / len(count_errors),
+        "count_error": sum(count_errors) / total_gt if total_gt else 0.0,
+        "speed_mae": sum(speed_errors) / len(speed_errors) if speed_errors else None,
+    }
+
+
+def pareto_front(rows: list, objectives=("seconds_per_clip", "count_error", "speed_mae")) -> set:
+    """
+    Indexes of the rows not dominated on all objectives (lower is better; None is ignored).
+    """
+    def values(row):
+        return [row[k] if row[k] is not None else 0.0 for k in objectives]
+
+    front = set()
+    for i, a in enumerate(rows):
+        va = values(a)
+        dominated = any(
+            all(x <= y for x, y in zip(values(b), va)) and any(x < y for x, y in zip(values(b), va))
+            for j, b in enumerate(rows) if j != i
+        )
+        if not dominated:
+            front.add(i)
+    return front
+
+
+def cheapest_meeting(rows: list, max_count_error: float, max_speed_error: float):
+    ok = [row for row in rows
+          if row["count_error"] <= max_count_error
+          and (row["speed_mae"] is None or row["speed_mae"] <= max_speed_error)]
+    return min(ok, key=lambda row: row["seconds_per_clip"]) if ok else None
+
+
+def describe(config: dict) -> str:
+    width, height = config["resolution"]
+    return (f"model={config['model']} tracker={config['tracker']} frame_skip={config['frame_skip']} "
+            f"res={width}x{height} imgsz={config['inference_size'] or 'default'} "
+            f"cooldown={config['cooldown_duration']:g}")
+
+
+def parse_resolution(value: str) -> tuple:
+    if value in Resolution.__members__:
+        return Resolution[value].value
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure throughput versus counting/speed accuracy of detector settings")
+    parser.add_argument("manifest", help="JSON-lines manifest of labeled clips")
+    parser.add_argument("--cams", help="Camera geometry JSON (as returned by GET /cams)")
+    parser.add_argument("--model", nargs="+", default=["yolo11n.pt"])
+    parser.add_argument("--tracker", nargs="+", default=["ultralytics"], choices=["ultralytics", "iou"])
+    parser.add_argument("--frame-skip", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--resolution", nargs="+", type=parse_resolution, default=[Resolution.Default.value],
+                        help="WIDTHxHEIGHT or a Resolution name, e.g. 320x240 R480p")
+    parser.add_argument("--inference-size", nargs="+", type=int, default=[0], help="YOLO imgsz, 0 for default")
+    parser.add_argument("--cooldown", nargs="+", type=float, default=[0.0, 2.0],
+                        help="Finish-line cooldown in seconds, 0 to count every crossing")
+    parser.add_argument("--max-count-error", type=float, default=0.05, help="Target relative count error")
+    parser.add_argument("--max-speed-error", type=float, default=5.0, help="Target speed MAE in km/h")
+    parser.add_argument("--output", help="Optional CSV with one row per configuration and camera")
+    args = parser.parse_args()
+
+    from ai_model import AIModelFactory
+
+    cams = load_cams(args.cams) if args.cams else {}
+    entries = list(iter_entries(args.manifest, cams))
+    grid = [dict(zip(GRID_KEYS, values)) for values in itertools.product(
+        args.model, args.tracker, args.frame_skip, args.resolution, args.inference_size, args.cooldown)]
+    for config in grid:
+        config["inference_size"] = config["inference_size"] or None
+    print(f"Evaluating {len(grid)} configurations on {len(entries)} clips")
+
+    # model.track registers Ultralytics' tracker callbacks on the model, which would then also
+    # filter model.predict, so the built-in tracker and our trackers never share a model
+    models = {}
+    rows = []
+    for config in grid:
+        model_key = (config["model"], config["tracker"] == "ultralytics")
+        if model_key not in models:
+            models[model_key] = AIModelFactory.create_model("yolo", config["model"])
+        runs_by_cam = defaultdict(list)
+        all_runs = []
+        for entry in entries:
+            run = (entry, run_clip(entry, models[model_key], config))
+            runs_by_cam[entry.get("traffic_cam_id")].append(run)
+            all_runs.append(run)
+        overall = {"traffic_cam_id": "all", "config": describe(config), **summarize(all_runs)}
+        rows.append(overall)
+        for cam_id, runs in runs_by_cam.items():
+            rows.append({"traffic_cam_id": cam_id, "config": describe(config), **summarize(runs)})
+        print(f"{overall['config']}: {overall['clips_per_hour']:.0f} clips/h, count error {overall['count_error']:.1%}"
+              f", speed MAE {overall['speed_mae'] if overall['speed_mae'] is not None else float('nan'):.1f} km/h")
+
+    for cam_id in dict.fromkeys(row["traffic_cam_id"] for row in rows):
+        cam_rows = [row for row in rows if row["traffic_cam_id"] == cam_id]
+        front = pareto_front(cam_rows)
+        for i, row in enumerate(cam_rows):
+            row["pareto"] = i in front
+        print(f"\nCamera {cam_id}:")
+        print(f"  {'':2s}{'s/clip':>8s} {'clips/h':>8s} {'x RT':>6s} {'count err':>10s} {'speed MAE':>10s}  config")
+        for row in sorted(cam_rows, key=lambda r: r["seconds_per_clip"]):
+            speed = f"{row['speed_mae']:.1f}" if row["speed_mae"] is not None else "-"
+            print(f"  {'*' if row['pareto'] else ' ':2s}{row['seconds_per_clip']:8.2f} {row['clips_per_hour']:8.0f} "
+                  f"{row['realtime_factor']:6.1f} {row['count_error']:10.1%} {speed:>10s}  {row['config']}")
+        best = cheapest_meeting(cam_rows, args.max_count_error, args.max_speed_error)
+        if best:
+            print(f"  Recommended: {best['config']}")
+        else:
+            print(f"  No configuration meets count error <= {args.max_count_error:.0%} "
+                  f"and speed MAE <= {args.max_speed_error:g} km/h")
+
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
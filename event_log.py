@@ -0,0 +1,99 @@
+import struct
+import zlib
+from datetime import datetime
+
+import numpy as np
+
+# Batch wire format: fixed header followed by a zlib-compressed body holding
+# every column back to back (column order and dtypes given by EVENT_COLUMNS).
+BATCH_MAGIC = b"TDEV"
+BATCH_VERSION = 2
+BATCH_HEADER = struct.Struct("<4sBIId")  # magic, version, traffic_cam_id, count, base timestamp
+
+EVENT_COLUMNS = (
+    ("track_id", np.dtype("<i4")),
+    ("class_id", np.dtype("<i2")),
+    ("zone_id", np.dtype("<i2")),     # 0 is the camera-wide start/finish pair, then the configured zones
+    ("start_time", np.dtype("<f4")),   # seconds since clip start, NaN if the start line was not seen
+    ("finish_time", np.dtype("<f4")),  # seconds since clip start, NaN if the finish line was not seen
+    ("speed", np.dtype("<f4")),        # km/h, NaN if the vehicle did not cross both lines
+)
+
+
+class CrossingEventLog:
+    """
+    Columnar, append-only log of per-vehicle line crossings.
+
+    Each column lives in its own NumPy array which grows geometrically, so
+    appending is amortised O(1) and a full clip costs ~20 bytes per event.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self._size = 0
+        self._columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in EVENT_COLUMNS}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __repr__(self) -> str:
+        return f"CrossingEventLog(events={self._size})"
+
+    def append(self, track_id: int, class_id: int, zone_id: int = 0, start_time: float = float("nan"),
+               finish_time: float = float("nan"), speed: float = float("nan")):
+        if self._size == len(self._columns["track_id"]):
+            self._grow()
+        i = self._size
+        self._columns["track_id"][i] = track_id
+        self._columns["class_id"][i] = class_id
+        self._columns["zone_id"][i] = zone_id
+        self._columns["start_time"][i] = start_time
+        self._columns["finish_time"][i] = finish_time
+        self._columns["speed"][i] = speed
+        self._size += 1
+
+    def column(self, name: str) -> np.ndarray:
+        """Returns a read-only view of a single column."""
+        view = self._columns[name][:self._size]
+        view.flags.writeable = False
+        return view
+
+    def _grow(self):
+        capacity = max(1, len(self._columns["track_id"])) * 2
+        for name, dtype in EVENT_COLUMNS:
+            grown = np.empty(capacity, dtype=dtype)
+            grown[:self._size] = self._columns[name][:self._size]
+            self._columns[name] = grown
+
+    def to_bytes(self, traffic_cam_id: int, start_datetime: datetime) -> bytes:
+        """
+        Encodes the log as a compact binary batch.
+
+        Args:
+            traffic_cam_id: Camera the events belong to.
+            start_datetime: Clip start; event times are offsets from it.
+        """
+        body = b"".join(self._columns[name][:self._size].tobytes() for name, _ in EVENT_COLUMNS)
+        header = BATCH_HEADER.pack(BATCH_MAGIC, BATCH_VERSION, traffic_cam_id, self._size,
+                                   start_datetime.timestamp())
+        return header + zlib.compress(body, 6)
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        """
+        Decodes a batch produced by to_bytes.
+
+        Returns:
+            A (traffic_cam_id, start_datetime, CrossingEventLog) tuple.
+        """
+        magic, version, traffic_cam_id, count, base_ts = BATCH_HEADER.unpack_from(data)
+        if magic != BATCH_MAGIC or version != BATCH_VERSION:
+            raise ValueError(f"Unsupported event batch (magic={magic!r}, version={version})")
+        body = zlib.decompress(data[BATCH_HEADER.size:])
+        log = cls(capacity=max(count, 1))
+        offset = 0
+        for name, dtype in EVENT_COLUMNS:
+            nbytes = count * dtype.itemsize
+            log._columns[name][:count] = np.frombuffer(body, dtype=dtype, count=count, offset=offset)
+            offset += nbytes
+        log._size = count
+        return traffic_cam_id, datetime.fromtimestamp(base_ts), log
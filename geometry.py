@@ -0,0 +1,138 @@
+import dataclasses
+import hashlib
+import json
+
+import cv2
+import numpy as np
+
+from models import Line, LineZone, Video
+from zones import ZoneSet
+
+
+class CameraGeometry:
+    """
+    Per-camera geometry derived once and shared by every clip of that camera.
+
+    Coordinates are pixels of the processed (resized) frame.
+
+    Attributes:
+        traffic_cam_id: The camera, or None for an ad-hoc geometry.
+        width, height: Processed frame size the geometry was built for.
+        zones: Zone 0 (the camera-wide start/finish pair) followed by the configured zones.
+        zone_set: The zones packed for vectorized crossing and containment tests.
+        ref_distances: Meters between start and finish line of each zone (None for polygons).
+        roi_mask: (height, width) boolean mask of the region of interest, or None for the whole frame.
+        homography: (3, 3) pixel to ground-plane meters homography, or None.
+    """
+
+    def __init__(self, traffic_cam_id, start_ref_line: Line, finish_ref_line: Line, ref_distance: float,
+                 zones: list = None, roi: list = None, homography=None, width: int = 1280, height: int = 720):
+        self.traffic_cam_id = traffic_cam_id
+        self.width = width
+        self.height = height
+        self.zones = [LineZone("default", start_ref_line, finish_ref_line, ref_distance, bounded=False)]
+        self.zones += list(zones or [])
+        self.zone_set = ZoneSet(self.zones)
+        self.roi = roi
+        self.homography = np.array(homography, dtype=np.float64).reshape(3, 3) if homography is not None else None
+
+        self.roi_mask = None
+        if roi:
+            mask = np.zeros((height, width), dtype=np.uint8)
+            cv2.fillPoly(mask, [np.array([(p.x, p.y) for p in roi], dtype=np.int32)], 1)
+            self.roi_mask = mask.astype(bool)
+
+        self.ref_distances = []
+        for zone in self.zones:
+            if not isinstance(zone, LineZone):
+                self.ref_distances.append(None)
+            elif zone.ref_distance is not None:
+                self.ref_distances.append(zone.ref_distance)
+            elif self.homography is not None:
+                # calibrated cameras measure each lane between the midpoints of its lines
+                midpoints = np.array([[(line.A.x + line.B.x) / 2, (line.A.y + line.B.y) / 2]
+                                      for line in (zone.start_line, zone.finish_line)])
+                start, finish = self.to_meters(midpoints)
+                self.ref_distances.append(float(np.linalg.norm(finish - start)))
+            else:
+                self.ref_distances.append(ref_distance)
+
+    @classmethod
+    def from_video(cls, video_obj: Video, width: int, height: int) -> "CameraGeometry":
+        return cls(video_obj.traffic_cam_id, video_obj.start_ref_line, video_obj.finish_ref_line,
+                   video_obj.ref_distance, zones=video_obj.zones, roi=video_obj.roi,
+                   homography=video_obj.homography, width=width, height=height)
+
+    def in_roi(self, points: np.ndarray) -> np.ndarray:
+        """(N,) mask of the (N, 2) points inside the region of interest."""
+        if self.roi_mask is None:
+            return np.ones(len(points), dtype=bool)
+        x = np.clip(points[:, 0].astype(np.int64), 0, self.width - 1)
+        y = np.clip(points[:, 1].astype(np.int64), 0, self.height - 1)
+        return self.roi_mask[y, x]
+
+    def to_meters(self, points: np.ndarray) -> np.ndarray:
+        """Maps (N, 2) pixel positions to ground-plane meters with the homography."""
+        if self.homography is None:
+            raise ValueError(f"Camera {self.traffic_cam_id} has no homography")
+        mapped = np.column_stack([points, np.ones(len(points))]) @ self.homography.T
+        return mapped[:, :2] / mapped[:, 2:3]
+
+    def fingerprint(self) -> dict:
+        """Everything in this geometry that affects the result, for use in cache keys."""
+        return {
+            "zones": [dataclasses.asdict(z) | {"type": type(z).__name__} for z in self.zones],
+            "roi": [dataclasses.asdict(p) for p in self.roi] if self.roi else None,
+            "homography": self.homography.tolist() if self.homography is not None else None,
+        }
+
+
+def geometry_version(video_obj: Video) -> str:
+    """
+    The camera's config_version when the video server sends one, otherwise a hash of its geometry.
+    """
+    if video_obj.config_version is not None:
+        return str(video_obj.config_version)
+    config = {
+        "start_ref_line": dataclasses.asdict(video_obj.start_ref_line),
+        "finish_ref_line": dataclasses.asdict(video_obj.finish_ref_line),
+        "ref_distance": video_obj.ref_distance,
+        "zones": [dataclasses.asdict(z) for z in video_obj.zones],
+        "roi": [dataclasses.asdict(p) for p in video_obj.roi] if video_obj.roi else None,
+        "homography": video_obj.homography,
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+
+class GeometryCache:
+    """
+    Keeps the latest CameraGeometry of each camera.
+
+    An entry is rebuilt when the camera's config version (or processed frame
+    size) changes, which also drops the geometry of the previous version.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, video_obj: Video, width: int, height: int) -> CameraGeometry:
+        key = (geometry_version(video_obj), width, height)
+        entry = self._entries.get(video_obj.traffic_cam_id)
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        geometry = CameraGeometry.from_video(video_obj, width, height)
+        self._entries[video_obj.traffic_cam_id] = (key, geometry)
+        return geometry
+
+    def invalidate(self, traffic_cam_id: int = None):
+        if traffic_cam_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(traffic_cam_id, None)
+
+    def stats(self) -> dict:
+        return {"cameras": len(self._entries), "hits": self.hits, "misses": self.misses}
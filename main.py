@@ -2,20 +2,59 @@ import asyncio
 import aiohttp
 import os
 import json
+import time
+from urllib.parse import quote
 
 from worker_pool import VideoProcessor
 from models import Video
+from spool import VideoSpool
+from detection_cache import DetectionStore
+from result_cache import ResultCache, file_sha256
 
 VIDEO_SERVER_URL = "https://safe-panda-enabled.ngrok-free.app/videos"
 
 DOWNLOAD_FOLDER = "downloaded_videos"
 os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
+SPOOL_MAX_BYTES = 5 * 1024 ** 3  # 5 GiB
+SPOOL_MAX_AGE = 24 * 60 * 60  # 1 day
+RESULT_CACHE_PATH = "result_cache.sqlite"
+# tracked detections of every processed clip, for `backfill.py detections --replay detections`
+DETECTIONS_FOLDER = "detections"
+DETECTIONS_MAX_BYTES = 2 * 1024 ** 3  # 2 GiB
+DETECTIONS_MAX_AGE = 30 * 24 * 60 * 60  # 30 days
+PREVIEW_HOST = "127.0.0.1"  # previews are unauthenticated; only expose them on a trusted interface
+PREVIEW_PORT = 8080  # annotated MJPEG previews at http://127.0.0.1:8080/preview/<traffic_cam_id>
+CPU_BUDGET = None  # cores shared by the workers, None for all; `python cpu_budget.py <clip>` suggests a split
+STATS_INTERVAL = 60  # seconds between scheduler/cache stats logs
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+DOWNLOAD_RESUME_ATTEMPTS = 5
+
+async def download_body(response: aiohttp.ClientResponse, part_path: str, append: bool) -> bool:
+    """
+    Streams the response body into part_path. Returns False if the transfer was cut short.
+    """
+    try:
+        with open(part_path, "ab" if append else "wb") as f:
+            async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+        return True
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"Download interrupted at {os.path.getsize(part_path)} bytes: {e}")
+        return False
+
 
 async def fetch_video(session: aiohttp.ClientSession):
     """
     Calls the API endpoint to get a video.
     Expects that the API returns the video file in the response body,
     and includes the metadata as a JSON string in the 'X-Video-Metadata' header.
+
+    The body is streamed to a '.part' file. If the transfer breaks, it is resumed
+    from /videos/<video_filename> with a Range request; the finished file is checked
+    against the 'X-Content-Length' and 'X-Content-SHA256' headers before it is used.
+
+    Returns:
+        A (metadata, video_path) tuple, or (None, None) if no verified video was fetched.
     """
     try:
         async with session.get(VIDEO_SERVER_URL) as response:
@@ -29,35 +68,89 @@ async def fetch_video(session: aiohttp.ClientSession):
                 print("No metadata header found in API response.")
                 return None, None
             metadata = json.loads(metadata_str)
-
-            # Read the video file (binary data) from the response.
-            video_data = await response.read()
             print(metadata)
-            return metadata, video_data
+
+            expected_size = int(response.headers.get("X-Content-Length", response.content_length or -1))
+            expected_sha256 = response.headers.get("X-Content-SHA256")
+            video_path = os.path.join(DOWNLOAD_FOLDER, metadata["video_filename"])
+            part_path = video_path + ".part"
+            complete = await download_body(response, part_path, append=False)
+
+        resume_url = f"{VIDEO_SERVER_URL}/{quote(metadata['video_filename'])}"
+        attempt = 0
+        while not complete and attempt < DOWNLOAD_RESUME_ATTEMPTS:
+            attempt += 1
+            offset = os.path.getsize(part_path)
+            await asyncio.sleep(attempt)
+            async with session.get(resume_url, headers={"Range": f"bytes={offset}-"}) as response:
+                if response.status == 206:
+                    complete = await download_body(response, part_path, append=True)
+                elif response.status == 200:
+                    # server ignored the range, start over
+                    complete = await download_body(response, part_path, append=False)
+                else:
+                    print(f"Resume of {metadata['video_filename']} failed with status {response.status}")
+                    break
+
+        size = os.path.getsize(part_path)
+        if not complete or (expected_size >= 0 and size != expected_size):
+            print(f"Incomplete download of {metadata['video_filename']}: {size}/{expected_size} bytes")
+            os.remove(part_path)
+            return None, None
+        if expected_sha256:
+            actual_sha256 = await asyncio.to_thread(file_sha256, part_path)
+            if actual_sha256 != expected_sha256:
+                print(f"Checksum mismatch for {metadata['video_filename']}, discarding download")
+                os.remove(part_path)
+                return None, None
+            metadata["sha256"] = actual_sha256
+
+        os.replace(part_path, video_path)
+        return metadata, video_path
 
     except Exception as e:
         print(f"Exception during fetch_video: {e}")
         return None, None
 
 async def main():
-    processor = VideoProcessor(num_workers=4)
+    spool = VideoSpool(DOWNLOAD_FOLDER, max_bytes=SPOOL_MAX_BYTES, max_age=SPOOL_MAX_AGE)
+    detection_store = DetectionStore(DETECTIONS_FOLDER, max_bytes=DETECTIONS_MAX_BYTES, max_age=DETECTIONS_MAX_AGE)
+    processor = VideoProcessor(num_workers=4, spool=spool, result_cache=ResultCache(RESULT_CACHE_PATH),
+                               preview_host=PREVIEW_HOST, preview_port=PREVIEW_PORT,
+                               cpu_budget=CPU_BUDGET,
+                               detection_store=detection_store)
     await processor.start()
+
+    # Drop expired clips and, if over budget, failed ones before requeueing.
+    spool.enforce()
+    detection_store.enforce()
+    # Requeue clips that were downloaded but not finished before the last shutdown,
+    # including failed ones (e.g. upload errors) with attempts left.
+    for video_path, metadata in spool.pending():
+        if metadata and os.path.exists(video_path):
+            await processor.add_video(Video.from_json(metadata))
+        else:
+            spool.release(video_path)
     sleep_time = 5
+    last_stats = time.monotonic()
     async with aiohttp.ClientSession() as session:
         # Infinite loop to poll the API every <sleep_time> seconds.
         while True:
-            metadata, video_data = await fetch_video(session)
-            if metadata and video_data:
-                video_path = os.path.join(DOWNLOAD_FOLDER, metadata["video_filename"])
-                with open(video_path, "wb") as f:
-                    f.write(video_data)
+            metadata, video_path = await fetch_video(session)
+            if metadata and video_path:
                 print(f"Downloaded video to {video_path}")
                 metadata["video_path"] = video_path
+                spool.add(video_path, metadata)
                 video_obj = Video.from_json(metadata)
                 await processor.add_video(video_obj)
             else:
                 print("No video fetched from API.")
 
+            if time.monotonic() - last_stats >= STATS_INTERVAL:
+                # per-camera queue depth, oldest clip age, skip/degrade counters, cache hits
+                print(f"VideoProcessor stats: {json.dumps(processor.stats(), default=str)}")
+                last_stats = time.monotonic()
+
             await asyncio.sleep(sleep_time)
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 from datetime import datetime
 from enum import Enum
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import List, Optional
 
 
 @dataclass
@@ -19,6 +20,49 @@ class Line:
         self.B = Point(bx, by)
 
 
+@dataclass
+class LineZone:
+    """A counting zone delimited by a start and a finish line (e.g. one lane and direction)."""
+    name: str
+    start_line: Line
+    finish_line: Line
+    ref_distance: Optional[float] = None  # falls back to the video's ref_distance
+    # Bounded zones only count tracks crossing the line segments themselves; the
+    # camera-wide start/finish pair keeps the historical infinite-line behaviour.
+    bounded: bool = True
+
+
+@dataclass
+class PolygonZone:
+    """A counting zone given by a polygon; vehicles are counted when they enter it."""
+    name: str
+    points: List[Point]
+
+
+def line_from_json(data: dict) -> Line:
+    return Line(data["ax"], data["ay"], data["bx"], data["by"])
+
+
+def zone_from_json(data: dict):
+    """
+    Builds a LineZone or PolygonZone from its JSON description:
+    {"name", "type": "lines", "start_ref_line", "finish_ref_line", "ref_distance"?}
+    or {"name", "type": "polygon", "points": [[x, y], ...]}.
+    """
+    zone_type = data.get("type", "lines")
+    if zone_type == "lines":
+        ref_distance = data.get("ref_distance")
+        return LineZone(
+            name=data["name"],
+            start_line=line_from_json(data["start_ref_line"]),
+            finish_line=line_from_json(data["finish_ref_line"]),
+            ref_distance=float(ref_distance) if ref_distance is not None else None
+        )
+    if zone_type == "polygon":
+        return PolygonZone(name=data["name"], points=[Point(x, y) for x, y in data["points"]])
+    raise ValueError(f"Unsupported zone type: {zone_type}")
+
+
 class Resolution(Enum):
     R2160p = (3840, 2160)  # 4K
     R1440p = (2560, 1440)  # 2K
@@ -48,6 +92,13 @@ class Video:
     finish_ref_line: Line
     ref_distance: int
     track_orientation: str = "horizontal"
+    zones: list = field(default_factory=list)
+    content_sha256: Optional[str] = None
+    # region of interest and pixel -> ground-plane meters homography, in processed-frame pixels
+    roi: Optional[List[Point]] = None
+    homography: Optional[List[List[float]]] = None
+    # bumped by the video server whenever the camera's geometry changes
+    config_version: Optional[int] = None
 
     @classmethod
     def from_json(cls, data: dict):
@@ -58,16 +109,21 @@ class Video:
         # Convert to Line objects
         s = data["start_ref_line"]
         f = data["finish_ref_line"]
-        start_line = Line(s["ax"], s["ay"], s["bx"], s["by"])
-        finish_line = Line(f["ax"], f["ay"], f["bx"], f["by"])
+        start_line = line_from_json(s)
+        finish_line = line_from_json(f)
 
         return cls(
             traffic_cam_id=data["traffic_cam_id"],
-            video_path=f"downloaded_videos/{data['video_filename']}",
+            video_path=data.get("video_path") or f"downloaded_videos/{data['video_filename']}",
             start_datetime=start_dt,
             end_datetime=end_dt,
             start_ref_line=start_line,
             finish_ref_line=finish_line,
             ref_distance=int(data["ref_distance"]),
-            track_orientation=data.get("track_orientation", "horizontal")
+            track_orientation=data.get("track_orientation", "horizontal"),
+            zones=[zone_from_json(z) for z in data.get("zones") or []],
+            content_sha256=data.get("sha256"),
+            roi=[Point(x, y) for x, y in data["roi"]] if data.get("roi") else None,
+            homography=data.get("homography"),
+            config_version=data.get("config_version")
         )
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+import time
+
+import cv2
+from aiohttp import web
+
+
+class PreviewChannel:
+    """
+    Latest annotated frame of one camera.
+
+    TrafficDetector asks want_frame() on every processed frame; it is only True
+    while at least one viewer is connected and the frame-rate cap allows it, so
+    without viewers nothing is drawn or JPEG-encoded.
+
+    Attributes:
+        max_fps: Maximum preview frame rate.
+        quality: JPEG quality (0-100).
+    """
+
+    def __init__(self, max_fps: float = 5.0, quality: int = 70):
+        self.max_fps = max_fps
+        self.quality = quality
+        self.latest = None
+        self._last_publish = 0.0
+        self._viewers = {}
+        self._lock = threading.Lock()
+
+    @property
+    def viewers(self) -> int:
+        return len(self._viewers)
+
+    def want_frame(self) -> bool:
+        return bool(self._viewers) and time.monotonic() - self._last_publish >= 1.0 / self.max_fps
+
+    def publish(self, frame):
+        """
+        Encodes and hands a frame to the connected viewers. Safe to call from executor threads.
+        """
+        self._last_publish = time.monotonic()
+        ret, buf = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.quality])
+        if not ret:
+            return
+        self.latest = buf.tobytes()
+        with self._lock:
+            viewers = list(self._viewers.items())
+        for event, loop in viewers:
+            loop.call_soon_threadsafe(event.set)
+
+    def subscribe(self) -> asyncio.Event:
+        event = asyncio.Event()
+        with self._lock:
+            self._viewers[event] = asyncio.get_running_loop()
+        return event
+
+    def unsubscribe(self, event: asyncio.Event):
+        with self._lock:
+            self._viewers.pop(event, None)
+
+
+class PreviewServer:
+    """
+    Serves each camera's annotated output as MJPEG at /preview/<traffic_cam_id>.
+
+    Runs on the VideoProcessor's event loop; /preview lists the cameras seen so far.
+    There is no authentication, so it listens on localhost unless told otherwise.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8080, max_fps: float = 5.0):
+        self.host = host
+        self.port = port
+        self.max_fps = max_fps
+        self.channels = {}
+        self._runner = None
+
+    def channel(self, traffic_cam_id: int) -> PreviewChannel:
+        if traffic_cam_id not in self.channels:
+            self.channels[traffic_cam_id] = PreviewChannel(max_fps=self.max_fps)
+        return self.channels[traffic_cam_id]
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/preview", self._index)
+        app.router.add_get("/preview/{cam_id:\\d+}", self._stream)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        print(f"PreviewServer: Serving previews on http://{self.host}:{self.port}/preview/<traffic_cam_id>")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _index(self, request: web.Request) -> web.Response:
+        return web.json_response({str(cam_id): {"viewers": ch.viewers} for cam_id, ch in self.channels.items()})
+
+    async def _stream(self, request: web.Request) -> web.StreamResponse:
+        channel = self.channel(int(request.match_info["cam_id"]))
+        response = web.StreamResponse(headers={"Content-Type": "multipart/x-mixed-replace; boundary=frame",
+                                               "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        event = channel.subscribe()
+        try:
+            while True:
+                await event.wait()
+                event.clear()
+                jpg = channel.latest
+                await response.write(b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + jpg + b"\r\n")
+        except ConnectionResetError:
+            pass
+        finally:
+            channel.unsubscribe(event)
+        return response
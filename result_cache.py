@@ -0,0 +1,111 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from event_log import CrossingEventLog
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Content-addressed cache of TrafficDetector results.
+
+    Entries are keyed by the clip's SHA-256 plus a fingerprint of the detection
+    config, so a clip that reaches a worker again (retries, requeues) skips
+    inference, while any change to the model, lines or sampling settings misses.
+    Stored in SQLite and bounded by total size, evicting least recently used
+    entries first.
+
+    Attributes:
+        max_bytes: Size budget for stored results in bytes.
+        hits: Number of lookups answered from the cache.
+        misses: Number of lookups that required processing.
+    """
+
+    def __init__(self, path: str = "result_cache.sqlite", max_bytes: int = 256 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY, result TEXT NOT NULL, events BLOB, size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self._db.commit()
+        self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    @staticmethod
+    def make_key(content_sha256: str, config: dict) -> str:
+        """
+        Args:
+            content_sha256: Hex SHA-256 of the clip file.
+            config: JSON-serialisable detection config (see TrafficDetector.config_fingerprint).
+        """
+        config_json = json.dumps(config, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(f"{content_sha256}:{config_json}".encode()).hexdigest()
+
+    def get(self, key: str):
+        """
+        Returns the stored result dict (with its CrossingEventLog) or None on a miss.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT result, events FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            self.hits += 1
+        result = json.loads(row[0])
+        if row[1] is not None:
+            result["events"] = CrossingEventLog.from_bytes(row[1])[2]
+        return result
+
+    def put(self, key: str, result: dict):
+        stored = {k: v for k, v in result.items() if k != "events"}
+        result_json = json.dumps(stored)
+        events = result.get("events")
+        events_blob = events.to_bytes(0, datetime.fromtimestamp(0)) if events is not None else None
+        size = len(result_json) + (len(events_blob) if events_blob else 0)
+        with self._lock:
+            row = self._db.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+            if row:
+                self._total -= row[0]
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, result, events, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, result_json, events_blob, size, time.time())
+            )
+            self._total += size
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        if self._total <= self.max_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM results ORDER BY last_used").fetchall():
+            if self._total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+            self._total -= size
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "bytes": self._total,
+        }
@@ -0,0 +1,146 @@
+import asyncio
+import time
+from collections import OrderedDict, deque, Counter
+from dataclasses import dataclass
+from typing import Optional
+
+from models import Video
+
+# Degradation ladder: (minimum age as a fraction of the deadline, frame_skip, inference size).
+# An inference size of None keeps the model's default input size.
+DEFAULT_DEGRADATION_LADDER = (
+    (0.0, 1, None),
+    (0.5, 2, None),
+    (0.7, 2, 480),
+    (0.85, 3, 320),
+)
+
+
+@dataclass
+class ProcessingPlan:
+    """How a scheduled clip should be processed."""
+    frame_skip: int = 1
+    inference_size: Optional[int] = None
+    level: int = 0
+    age: float = 0.0
+    skip: bool = False
+
+
+class FairVideoScheduler:
+    """
+    Round-robin, deadline-aware queue of Video objects.
+
+    Clips are queued per traffic_cam_id and handed out one camera at a time,
+    so a chatty camera cannot starve the others. Every clip is stamped on
+    arrival; when it is handed out its age decides how cheaply it must be
+    processed (see DEFAULT_DEGRADATION_LADDER), and clips older than the
+    deadline are returned with a skip plan instead of being processed late.
+
+    Mirrors the parts of asyncio.Queue used by the workers: put, get,
+    task_done and join.
+
+    Attributes:
+        deadline: Seconds a clip may wait before it is considered stale.
+        ladder: Degradation ladder, ordered by increasing age fraction.
+        drop_stale: Whether clips past the deadline are skipped.
+    """
+
+    def __init__(self, deadline: float = 120.0, ladder=DEFAULT_DEGRADATION_LADDER, drop_stale: bool = True):
+        self.deadline = deadline
+        self.ladder = ladder
+        self.drop_stale = drop_stale
+        self._queues = OrderedDict()
+        self._not_empty = asyncio.Event()
+        self._all_done = asyncio.Event()
+        self._all_done.set()
+        self._unfinished = 0
+        self._enqueued = Counter()
+        self._skipped = Counter()
+        self._levels = Counter()
+
+    def qsize(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    async def put(self, video_obj: Video):
+        """
+        Adds a clip to its camera's queue.
+
+        Args:
+            video_obj: A Video instance containing video metadata and file path.
+        """
+        cam_id = video_obj.traffic_cam_id
+        self._queues.setdefault(cam_id, deque()).append((time.monotonic(), video_obj))
+        self._enqueued[cam_id] += 1
+        self._unfinished += 1
+        self._all_done.clear()
+        self._not_empty.set()
+
+    async def get(self) -> tuple:
+        """
+        Waits for the next clip in round-robin order.
+
+        Returns:
+            A (Video, ProcessingPlan) tuple.
+        """
+        while not self._queues:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+
+        cam_id, queue = next(iter(self._queues.items()))
+        enqueued_at, video_obj = queue.popleft()
+        # move the camera to the back of the rotation, or drop it once drained
+        if queue:
+            self._queues.move_to_end(cam_id)
+        else:
+            del self._queues[cam_id]
+
+        plan = self.plan(time.monotonic() - enqueued_at)
+        if plan.skip:
+            self._skipped[cam_id] += 1
+            print(f"Scheduler: Skipping stale video from camera {cam_id} "
+                  f"(age {plan.age:.1f}s > deadline {self.deadline:.0f}s)")
+        else:
+            self._levels[plan.level] += 1
+            if plan.level:
+                print(f"Scheduler: Degrading video from camera {cam_id} to level {plan.level} "
+                      f"(age {plan.age:.1f}s, frame_skip={plan.frame_skip}, inference_size={plan.inference_size})")
+        return video_obj, plan
+
+    def plan(self, age: float) -> ProcessingPlan:
+        """
+        Picks the processing plan for a clip that has waited `age` seconds.
+        """
+        fraction = age / self.deadline if self.deadline > 0 else 0.0
+        if self.drop_stale and fraction >= 1.0:
+            return ProcessingPlan(age=age, skip=True)
+
+        level = 0
+        for i, (min_fraction, _, _) in enumerate(self.ladder):
+            if fraction >= min_fraction:
+                level = i
+        _, frame_skip, inference_size = self.ladder[level]
+        return ProcessingPlan(frame_skip=frame_skip, inference_size=inference_size, level=level, age=age)
+
+    def task_done(self):
+        self._unfinished -= 1
+        if self._unfinished <= 0:
+            self._unfinished = 0
+            self._all_done.set()
+
+    async def join(self):
+        await self._all_done.wait()
+
+    def stats(self) -> dict:
+        """
+        Snapshot of the scheduling policy state, for logging and monitoring.
+        """
+        now = time.monotonic()
+        oldest = min((q[0][0] for q in self._queues.values() if q), default=None)
+        return {
+            "pending": {cam_id: len(q) for cam_id, q in self._queues.items()},
+            "oldest_age": now - oldest if oldest is not None else 0.0,
+            "deadline": self.deadline,
+            "enqueued": dict(self._enqueued),
+            "skipped": dict(self._skipped),
+            "levels": dict(self._levels),
+        }
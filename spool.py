@@ -0,0 +1,158 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+class VideoSpool:
+    """
+    Size- and age-bounded directory of downloaded clips.
+
+    Every file handed to the spool is recorded in a small SQLite index inside
+    the directory, so the running total survives restarts without rescanning
+    the directory. Files are deleted once their result has been uploaded.
+    Clips that failed to process or upload are retried after a restart up to
+    max_attempts times. When the budget is exceeded, clips that used up their
+    attempts go first, then retryable failed clips, then the oldest queued ones.
+
+    Attributes:
+        directory: Directory holding the clips.
+        max_bytes: Total size budget in bytes, or None for no size limit.
+        max_age: Maximum clip age in seconds, or None for no age limit.
+        max_attempts: Processing/upload attempts before a failed clip is no longer requeued.
+    """
+
+    INDEX_FILENAME = ".spool.sqlite"
+
+    def __init__(self, directory: str, max_bytes: Optional[int] = None, max_age: Optional[float] = None,
+                 max_attempts: int = 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_attempts = max_attempts
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, self.INDEX_FILENAME), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            " path TEXT PRIMARY KEY, size INTEGER NOT NULL, added REAL NOT NULL,"
+            " state TEXT NOT NULL DEFAULT 'pending', metadata TEXT, attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(spool)")]
+        if "attempts" not in columns:
+            self._db.execute("ALTER TABLE spool ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        self._db.execute("CREATE INDEX IF NOT EXISTS spool_added ON spool (added)")
+        self._db.commit()
+        self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM spool").fetchone()[0]
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total
+
+    def add(self, path: str, metadata: dict = None) -> list:
+        """
+        Registers a newly written clip and enforces the budget.
+
+        Args:
+            path: Path of the clip file.
+            metadata: Optional JSON-serialisable metadata kept for requeueing after a restart.
+
+        Returns:
+            The paths evicted to make room.
+        """
+        size = os.path.getsize(path)
+        with self._lock:
+            row = self._db.execute("SELECT size FROM spool WHERE path = ?", (path,)).fetchone()
+            if row:
+                self._total -= row[0]
+            self._db.execute(
+                "INSERT OR REPLACE INTO spool (path, size, added, state, metadata) VALUES (?, ?, ?, 'pending', ?)",
+                (path, size, time.time(), json.dumps(metadata) if metadata is not None else None)
+            )
+            self._db.commit()
+            self._total += size
+        return self.enforce(keep=path)
+
+    def release(self, path: str):
+        """
+        Deletes a clip whose result has been uploaded.
+        """
+        with self._lock:
+            self._remove(path)
+            self._db.commit()
+
+    def mark_failed(self, path: str):
+        """
+        Keeps a clip that could not be processed or uploaded, to be requeued by pending()
+        until it has used up max_attempts.
+        """
+        with self._lock:
+            self._db.execute("UPDATE spool SET state = 'failed', attempts = attempts + 1 WHERE path = ?", (path,))
+            self._db.commit()
+
+    def pending(self) -> list:
+        """
+        Returns (path, metadata) for clips that were queued but never finished, and for
+        failed clips with attempts left, oldest first.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT path, metadata FROM spool WHERE state = 'pending' OR attempts < ? ORDER BY added",
+                (self.max_attempts,)
+            ).fetchall()
+        return [(path, json.loads(metadata) if metadata else None) for path, metadata in rows]
+
+    def enforce(self, keep: str = None) -> list:
+        """
+        Evicts expired clips, then exhausted, failed and oldest clips until the size budget is met.
+
+        A queued clip that is evicted is reported as skipped by the worker that picks it up.
+
+        Args:
+            keep: A path that must not be evicted (typically the clip just added).
+
+        Returns:
+            The evicted paths.
+        """
+        evicted = []
+        with self._lock:
+            if self.max_age is not None:
+                cutoff = time.time() - self.max_age
+                rows = self._db.execute("SELECT path FROM spool WHERE added < ?", (cutoff,)).fetchall()
+                evicted.extend(path for path, in rows if path != keep)
+            if self.max_bytes is not None and self._total > self.max_bytes:
+                excess = self._total - self.max_bytes
+                excess -= sum(self._size_of(path) for path in evicted)
+                rows = self._db.execute(
+                    "SELECT path, size FROM spool ORDER BY attempts >= ? DESC, state = 'failed' DESC, added",
+                    (self.max_attempts,)
+                ).fetchall()
+                for path, size in rows:
+                    if excess <= 0:
+                        break
+                    if path == keep or path in evicted:
+                        continue
+                    evicted.append(path)
+                    excess -= size
+            for path in evicted:
+                self._remove(path)
+            self._db.commit()
+        for path in evicted:
+            print(f"VideoSpool: Evicted '{path}' ({self._total} bytes spooled)")
+        return evicted
+
+    def _size_of(self, path: str) -> int:
+        row = self._db.execute("SELECT size FROM spool WHERE path = ?", (path,)).fetchone()
+        return row[0] if row else 0
+
+    def _remove(self, path: str):
+        row = self._db.execute("SELECT size FROM spool WHERE path = ?", (path,)).fetchone()
+        if row:
+            self._total -= row[0]
+            self._db.execute("DELETE FROM spool WHERE path = ?", (path,))
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
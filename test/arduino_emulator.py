@@ -1,93 +1,230 @@
-import cv2
+import argparse
+import random
+import threading
 import time
+
+import cv2
 import numpy as np
-from flask import Flask, Response
+from flask import Flask, Response, abort, jsonify
 
 app = Flask(__name__)
 
-def gen_frames():
+# Cámaras emuladas, indexadas por id (se llenan en main)
+cameras = {}
+
+
+def mjpeg_part(jpg_bytes: bytes) -> bytes:
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n'
+            b'Content-Length: ' + str(len(jpg_bytes)).encode() + b'\r\n\r\n' + jpg_bytes + b'\r\n')
+
+
+def load_jpeg_frames(video_path: str, width: int, height: int, fps: float, quality: int, max_frames: int):
     """
-    Lee un archivo de vídeo ('video.mp4') y lo emite a 15 fps,
-    manteniendo la velocidad de reproducción original.
+    Lee el vídeo una sola vez, lo remuestrea a `fps` y codifica cada cuadro a JPEG.
+    Devuelve la lista de partes MJPEG ya listas para enviar, compartida por todos los clientes.
     """
-    cap = cv2.VideoCapture('video.mp4')
+    cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
-        # Si no abre el vídeo, emite un fondo negro constante
-        print("WARNING: No pudo abrir 'video.mp4'. Emisión de negro.")
-        blank = (0 * np.ones((240, 320, 3), dtype=np.uint8))
-        ret, buf = cv2.imencode('.jpg', blank, [int(cv2.IMWRITE_JPEG_QUALITY), 70])
-        black_jpg = buf.tobytes()
-        while True:
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + black_jpg + b'\r\n')
+        # Si no abre el vídeo, se emite un fondo negro constante
+        print(f"WARNING: No pudo abrir '{video_path}'. Emisión de negro.")
+        return black_frames(width, height, quality)
 
     # Obtener fps original del vídeo; si es 0 o inválido, asumimos 30 fps.
     src_fps = cap.get(cv2.CAP_PROP_FPS)
     if src_fps <= 0:
         src_fps = 30.0
+    frame_ratio = src_fps / fps  # ej: si src=30 y fps=15, ratio=2
 
-    target_fps = 15.0
-    frame_ratio = src_fps / target_fps  # ej: si src=30, ratio=2
-
-    # Inicializamos contadores y tiempo de inicio
-    frame_count = 0         # cuadros leídos desde el principio (0-based)
-    emitted_frames = 0      # cuántos cuadros hemos emitido
-    start_time = time.time()
-
-    # Forzamos resolución menor para lectura más ligera (opcional)
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 320)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 240)
-
-    while True:
+    frames = []
+    frame_count = 0
+    while len(frames) < max_frames:
         success, frame = cap.read()
         if not success:
-            # Si se termina el vídeo, reiniciamos contadores y volvemos al inicio
-            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-            frame_count = 0
-            emitted_frames = 0
-            start_time = time.time()
-            continue
-
+            break
         frame_count += 1
-
-        # Decidir si este cuadro debe emitirse:
-        # Emitir cuando frame_count >= (emitted_frames + 1) * frame_ratio
-        if frame_count < (emitted_frames + 1) * frame_ratio:
-            # Si no alcanza el umbral, saltamos este frame
+        # Emitir cuando frame_count >= (emitidos + 1) * frame_ratio
+        if frame_count < (len(frames) + 1) * frame_ratio:
             continue
+        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        ret, buf = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+        if ret:
+            frames.append(mjpeg_part(buf.tobytes()))
+    cap.release()
+    if not frames:
+        # Abre pero no hay cuadros decodificables (o --max-frames 0): también negro
+        print(f"WARNING: '{video_path}' no tiene cuadros decodificables. Emisión de negro.")
+        return black_frames(width, height, quality)
+    print(f"'{video_path}': {len(frames)} cuadros pre-codificados a {width}x{height} @ {fps:g} fps")
+    return frames
 
-        # Esperar hasta que sea el momento real de emitir
-        ideal_emit_time = start_time + (emitted_frames / target_fps)
-        now = time.time()
-        if now < ideal_emit_time:
-            time.sleep(ideal_emit_time - now)
 
-        # Codificar y enviar este "frame a 15 fps"
-        ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 70])
-        if not ret:
-            # Si falla la codificación, no contamos como emitido y seguimos
-            continue
+def black_frames(width: int, height: int, quality: int):
+    blank = np.zeros((height, width, 3), dtype=np.uint8)
+    ret, buf = cv2.imencode('.jpg', blank, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    return [mjpeg_part(buf.tobytes())]
 
-        jpg_bytes = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + jpg_bytes + b'\r\n')
 
-        emitted_frames += 1
+class EmulatedCamera:
+    """
+    Una cámara emulada. Un único hilo "reloj" por cámara avanza el cuadro actual
+    al ritmo configurado; los clientes solo esperan el siguiente cuadro y envían
+    los bytes ya codificados, así que el costo por cliente es casi nulo.
+
+    Fallos inyectados (probabilidades por cuadro):
+        drop_rate: el cuadro se salta (los clientes no lo reciben).
+        stall_rate: el reloj se congela `stall_seconds` segundos.
+        disconnect_rate: se cierra la conexión del cliente.
+    """
 
-    cap.release()
+    def __init__(self, cam_id: int, frames: list, fps: float, offset: int = 0, drop_rate: float = 0.0,
+                 stall_rate: float = 0.0, stall_seconds: float = 5.0, disconnect_rate: float = 0.0):
+        self.cam_id = cam_id
+        self.frames = frames
+        self.fps = fps
+        self.drop_rate = drop_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.disconnect_rate = disconnect_rate
+        self.index = offset % len(frames)
+        self.seq = 0
+        self.clients = 0
+        self.frames_sent = 0
+        self.dropped = 0
+        self.stalls = 0
+        self.disconnects = 0
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._clock, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def _clock(self):
+        interval = 1.0 / self.fps
+        next_tick = time.monotonic()
+        while True:
+            next_tick += interval
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Si nos atrasamos, no intentamos recuperar cuadros perdidos
+                next_tick = time.monotonic()
+
+            if self.stall_rate and random.random() < self.stall_rate:
+                self.stalls += 1
+                time.sleep(self.stall_seconds)
+                next_tick = time.monotonic()
+
+            self.index = (self.index + 1) % len(self.frames)
+            if self.drop_rate and random.random() < self.drop_rate:
+                self.dropped += 1
+                continue
+            with self.cond:
+                self.seq += 1
+                self.cond.notify_all()
+
+    def stream(self):
+        """Generador MJPEG para un cliente: espera cada cuadro nuevo y lo envía tal cual."""
+        last_seq = self.seq
+        with self.cond:
+            self.clients += 1
+        try:
+            while True:
+                with self.cond:
+                    self.cond.wait_for(lambda: self.seq != last_seq)
+                    last_seq = self.seq
+                    part = self.frames[self.index]
+                if self.disconnect_rate and random.random() < self.disconnect_rate:
+                    self.disconnects += 1
+                    return
+                yield part
+                self.frames_sent += 1
+        finally:
+            with self.cond:
+                self.clients -= 1
+
+    def stats(self) -> dict:
+        return {
+            "cam_id": self.cam_id,
+            "fps": self.fps,
+            "clients": self.clients,
+            "frames_sent": self.frames_sent,
+            "dropped": self.dropped,
+            "stalls": self.stalls,
+            "disconnects": self.disconnects,
+        }
+
+
+def mjpeg_response(cam: EmulatedCamera):
+    return Response(cam.stream(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
 
 @app.route('/stream')
 def stream():
     """
-    Endpoint MJPEG: multipart/x-mixed-replace; boundary=frame
+    Endpoint MJPEG de la cámara 0 (compatible con el emulador original):
+    multipart/x-mixed-replace; boundary=frame
     """
-    return Response(
-        gen_frames(),
-        mimetype='multipart/x-mixed-replace; boundary=frame'
-    )
+    return mjpeg_response(cameras[0])
+
+
+@app.route('/stream/<int:cam_id>')
+def stream_cam(cam_id):
+    """Endpoint MJPEG de la cámara `cam_id`."""
+    cam = cameras.get(cam_id)
+    if cam is None:
+        abort(404)
+    return mjpeg_response(cam)
+
+
+@app.route('/stats')
+def stats():
+    """Clientes conectados, cuadros enviados y fallos inyectados por cámara."""
+    return jsonify([cam.stats() for cam in cameras.values()])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Emulador de N cámaras MJPEG para pruebas de carga')
+    parser.add_argument('--video', action='append', default=None,
+                        help="Vídeo fuente; se puede repetir, las cámaras los usan en rotación (default: video.mp4)")
+    parser.add_argument('--cameras', type=int, default=1, help='Número de cámaras emuladas')
+    parser.add_argument('--fps', type=float, default=15.0, help='Cuadros por segundo de cada cámara')
+    parser.add_argument('--width', type=int, default=320)
+    parser.add_argument('--height', type=int, default=240)
+    parser.add_argument('--quality', type=int, default=70, help='Calidad JPEG (0-100)')
+    parser.add_argument('--max-frames', type=int, default=900, help='Máximo de cuadros pre-codificados por vídeo')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='Probabilidad de saltar un cuadro')
+    parser.add_argument('--stall-rate', type=float, default=0.0, help='Probabilidad por cuadro de congelar la cámara')
+    parser.add_argument('--stall-seconds', type=float, default=5.0, help='Duración de cada congelamiento')
+    parser.add_argument('--disconnect-rate', type=float, default=0.0,
+                        help='Probabilidad por cuadro de cerrar la conexión del cliente')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    # Cada vídeo se codifica una sola vez y se comparte entre las cámaras que lo usan
+    videos = args.video or ['video.mp4']
+    encoded = {path: load_jpeg_frames(path, args.width, args.height, args.fps, args.quality, args.max_frames)
+               for path in dict.fromkeys(videos)}
+
+    for cam_id in range(args.cameras):
+        frames = encoded[videos[cam_id % len(videos)]]
+        # Desfase distinto por cámara para que cada flujo muestre otra escena
+        offset = (cam_id // len(videos)) * len(frames) // max(1, -(-args.cameras // len(videos)))
+        cam = EmulatedCamera(cam_id, frames, args.fps, offset=offset, drop_rate=args.drop_rate,
+                             stall_rate=args.stall_rate, stall_seconds=args.stall_seconds,
+                             disconnect_rate=args.disconnect_rate)
+        cameras[cam_id] = cam
+        cam.start()
+
+    print(f"{args.cameras} cámaras en /stream/<id> (0..{args.cameras - 1}), estadísticas en /stats")
+    # Flask escuchando en 0.0.0.0:<port>
+    app.run(host='0.0.0.0', port=args.port, threaded=True)
 
 
 if __name__ == '__main__':
-    # Flask escuchando en 0.0.0.0:5000
-    app.run(host='0.0.0.0', port=5000, threaded=True)
+    main()
@@ -1,3 +1,5 @@
+import struct
+
 from flask import Flask, request, jsonify
 
 app = Flask(__name__)
@@ -19,5 +21,25 @@ def new_register():
 
     return jsonify({"message": "Register received successfully"}), 200
 
+# Must match BATCH_HEADER in event_log.py: magic, version, traffic_cam_id, count, base timestamp
+EVENT_BATCH_HEADER = struct.Struct("<4sBIId")
+
+
+@app.route('/events', methods=['POST'])
+def new_events():
+    data = request.get_data()
+    if len(data) < EVENT_BATCH_HEADER.size:
+        return jsonify({"error": "Truncated event batch"}), 400
+
+    magic, version, traffic_cam_id, count, base_ts = EVENT_BATCH_HEADER.unpack_from(data)
+    if magic != b"TDEV":
+        return jsonify({"error": "Not an event batch"}), 400
+
+    print(f"Received {count} events from camera {traffic_cam_id} (v{version}, {len(data)} bytes)")
+
+    # TODO: Append batch to event storage
+
+    return jsonify({"message": "Events received successfully"}), 200
+
 if __name__ == '__main__':
     app.run(host="localhost", port=6000, debug=True)
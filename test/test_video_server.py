@@ -8,6 +8,7 @@ import os
 import urllib.request
 import numpy as np
 import json
+import hashlib
 import mimetypes
 from datetime import datetime
 
@@ -39,6 +40,15 @@ class TrafficCam(db.Model):
     finish_by = db.Column(db.Float, nullable=False)
     ref_distance = db.Column(db.Float, nullable=False)
     track_orientation = db.Column(db.String(16), nullable=False)
+    # Zonas adicionales (carriles, direcciones) en JSON: lista de
+    # {"name", "type": "lines", "start_ref_line", "finish_ref_line", "ref_distance"?}
+    # o {"name", "type": "polygon", "points": [[x, y], ...]}
+    zones = db.Column(db.Text, nullable=True)
+    # Región de interés [[x, y], ...] y homografía 3x3 de píxeles a metros sobre el piso, en JSON
+    roi = db.Column(db.Text, nullable=True)
+    homography = db.Column(db.Text, nullable=True)
+    # Se incrementa con cada cambio de geometría para invalidar las cachés de los clientes
+    config_version = db.Column(db.Integer, nullable=False, default=1)
 
     def to_dict(self):
         return {
@@ -49,7 +59,11 @@ class TrafficCam(db.Model):
             'start_ref_line': {'ax': self.start_ax, 'ay': self.start_ay, 'bx': self.start_bx, 'by': self.start_by},
             'finish_ref_line': {'ax': self.finish_ax, 'ay': self.finish_ay, 'bx': self.finish_bx, 'by': self.finish_by},
             'ref_distance': self.ref_distance,
-            'track_orientation': self.track_orientation
+            'track_orientation': self.track_orientation,
+            'zones': json.loads(self.zones) if self.zones else [],
+            'roi': json.loads(self.roi) if self.roi else None,
+            'homography': json.loads(self.homography) if self.homography else None,
+            'config_version': self.config_version
         }
 
 
@@ -72,11 +86,36 @@ class VideoMetadata(db.Model):
         }
 
 
+# --- Modelo para el spool de videos en disco ---
+class SpoolEntry(db.Model):
+    __tablename__ = 'video_spool'
+    video_filename = db.Column(db.String(256), primary_key=True)
+    size_bytes = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.Float, nullable=False)
+    served_at = db.Column(db.Float, nullable=True)
+    sha256 = db.Column(db.String(64), nullable=True)
+
+
 # --- Inicialización DB ---
+def add_missing_column(table, column, ddl_type):
+    columns = [c['name'] for c in db.inspect(db.engine).get_columns(table)]
+    if column not in columns:
+        with db.engine.begin() as conn:
+            conn.execute(db.text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl_type}'))
+
+
 def init_db():
-    if not os.path.exists(db_path):
-        with app.app_context():
-            db.create_all()
+    new_db = not os.path.exists(db_path)
+    with app.app_context():
+        # create_all solo crea las tablas que falten (p. ej. video_spool en una BD existente)
+        db.create_all()
+        # Migraciones: agregar columnas nuevas a tablas existentes
+        add_missing_column('traffic_cams', 'zones', 'TEXT')
+        add_missing_column('traffic_cams', 'roi', 'TEXT')
+        add_missing_column('traffic_cams', 'homography', 'TEXT')
+        add_missing_column('traffic_cams', 'config_version', 'INTEGER NOT NULL DEFAULT 1')
+        add_missing_column('video_spool', 'sha256', 'VARCHAR(64)')
+        if new_db:
             # Insertar cámaras de ejemplo
             example2 = TrafficCam(
                 traffic_cam_id=1,
@@ -110,6 +149,56 @@ os.makedirs(output_dir, exist_ok=True)
 
 ESP32_CAM_STREAM_URL = "https://unlikely-above-sunbeam.ngrok-free.app/stream"  # URL de Ngrok
 
+# --- Presupuesto del spool de videos ---
+SPOOL_MAX_BYTES = 2 * 1024 ** 3  # 2 GiB en disco como máximo
+SPOOL_MAX_AGE = 24 * 60 * 60  # los videos más viejos de 1 día se eliminan
+SPOOL_SERVED_GRACE = 10 * 60  # un video servido se conserva 10 min por si hay que reenviarlo
+
+
+def file_sha256(path):
+    """SHA-256 del archivo; se calcula una vez al guardar el video y se envía como cabecera."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# --- Spool: registro y desalojo de videos ---
+def evict_video(entry):
+    """Elimina el archivo, su registro en la cola y su entrada en el spool."""
+    try:
+        os.remove(os.path.join(output_dir, entry.video_filename))
+    except FileNotFoundError:
+        pass
+    VideoMetadata.query.filter_by(video_filename=entry.video_filename).delete()
+    db.session.delete(entry)
+
+
+def enforce_spool_budget():
+    """
+    Aplica el presupuesto del spool usando solo la tabla video_spool (sin recorrer el directorio):
+    primero borra los videos ya servidos y los que superan la edad máxima, luego los
+    más antiguos (servidos primero) hasta quedar por debajo de SPOOL_MAX_BYTES.
+    """
+    now = time.time()
+    expired = SpoolEntry.query.filter(
+        db.or_(SpoolEntry.served_at < now - SPOOL_SERVED_GRACE, SpoolEntry.created_at < now - SPOOL_MAX_AGE)
+    ).all()
+    for entry in expired:
+        evict_video(entry)
+
+    total = db.session.query(db.func.coalesce(db.func.sum(SpoolEntry.size_bytes), 0)).scalar()
+    if total > SPOOL_MAX_BYTES:
+        oldest_first = SpoolEntry.query.order_by(SpoolEntry.served_at.is_(None), SpoolEntry.created_at)
+        for entry in oldest_first:
+            if total <= SPOOL_MAX_BYTES:
+                break
+            total -= entry.size_bytes
+            print(f"Spool lleno, eliminando {entry.video_filename}")
+            evict_video(entry)
+    db.session.commit()
+
 
 # --- Captura y guardado de video ---
 def capture_stream():
@@ -168,7 +257,14 @@ def capture_stream():
                         traffic_cam_id=2
                     )
                     db.session.add(meta)
+                    db.session.add(SpoolEntry(
+                        video_filename=os.path.basename(video_name),
+                        size_bytes=os.path.getsize(video_name),
+                        created_at=now,
+                        sha256=file_sha256(video_name)
+                    ))
                     db.session.commit()
+                    enforce_spool_budget()
 
                 break  # Termina este video y reconecta para el siguiente
 
@@ -203,7 +299,10 @@ def add_cam():
         finish_ax=data['finish_ref_line']['ax'], finish_ay=data['finish_ref_line']['ay'],
         finish_bx=data['finish_ref_line']['bx'], finish_by=data['finish_ref_line']['by'],
         ref_distance=data['ref_distance'],
-        track_orientation=data['track_orientation']
+        track_orientation=data['track_orientation'],
+        zones=json.dumps(data['zones']) if data.get('zones') else None,
+        roi=json.dumps(data['roi']) if data.get('roi') else None,
+        homography=json.dumps(data['homography']) if data.get('homography') else None
     )
     db.session.add(cam)
     db.session.commit()
@@ -238,10 +337,39 @@ def update_cam(cam_id):
         cam.ref_distance = data['ref_distance']
     if 'track_orientation' in data:
         cam.track_orientation = data['track_orientation']
+    if 'zones' in data:
+        cam.zones = json.dumps(data['zones']) if data['zones'] else None
+    if 'roi' in data:
+        cam.roi = json.dumps(data['roi']) if data['roi'] else None
+    if 'homography' in data:
+        cam.homography = json.dumps(data['homography']) if data['homography'] else None
+    geometry_fields = ('start_ref_line', 'finish_ref_line', 'ref_distance', 'track_orientation', 'zones', 'roi',
+                       'homography')
+    if any(field in data for field in geometry_fields):
+        cam.config_version = (cam.config_version or 1) + 1
     db.session.commit()
     return jsonify(cam.to_dict())
 
 
+# --- Envío de archivos de video ---
+def send_video_file(video_filepath, spool_entry=None):
+    """
+    Envía el archivo con soporte de peticiones Range (conditional=True), Content-Length,
+    ETag y la suma SHA-256 en X-Content-SHA256. send_file entrega el archivo abierto a
+    wsgi.file_wrapper; bajo gunicorn (ver create_app) las descargas completas se envían con
+    os.sendfile sin copiar el contenido por Python. Las reanudaciones con Range pasan por el
+    envoltorio de rangos de Werkzeug. El servidor de desarrollo (app.run) no tiene sendfile.
+    """
+    mime_type, _ = mimetypes.guess_type(video_filepath)
+    resp = send_file(video_filepath, mimetype=mime_type or 'application/octet-stream', as_attachment=True,
+                     conditional=True, etag=spool_entry.sha256 if spool_entry and spool_entry.sha256 else True)
+    resp.headers['Accept-Ranges'] = 'bytes'
+    resp.headers['X-Content-Length'] = str(os.path.getsize(video_filepath))
+    if spool_entry and spool_entry.sha256:
+        resp.headers['X-Content-SHA256'] = spool_entry.sha256
+    return resp
+
+
 # --- Endpoint para servir videos con metadata desde DB ---
 @app.route('/videos', methods=['GET'])
 def get_video():
@@ -254,6 +382,7 @@ def get_video():
     if not os.path.exists(video_filepath):
         # Si el archivo no existe, eliminar registro y devolver error
         db.session.delete(video_meta)
+        SpoolEntry.query.filter_by(video_filename=video_meta.video_filename).delete()
         db.session.commit()
         return jsonify({"message": "Archivo de video no encontrado"}), 404
 
@@ -273,22 +402,72 @@ def get_video():
             'start_ref_line': cam_meta.get('start_ref_line'),
             'finish_ref_line': cam_meta.get('finish_ref_line'),
             'ref_distance': cam_meta.get('ref_distance'),
-            'track_orientation': cam_meta.get('track_orientation')
+            'track_orientation': cam_meta.get('track_orientation'),
+            'zones': cam_meta.get('zones'),
+            'roi': cam_meta.get('roi'),
+            'homography': cam_meta.get('homography'),
+            'config_version': cam_meta.get('config_version')
         })
 
-    mime_type, _ = mimetypes.guess_type(video_filepath)
-    resp = send_file(video_filepath, mimetype=mime_type or 'application/octet-stream', as_attachment=True)
+    spool_entry = SpoolEntry.query.get(video_meta.video_filename)
+    resp = send_video_file(video_filepath, spool_entry)
     resp.headers['X-Video-Metadata'] = json.dumps(combined_meta)
 
-    # Eliminar el video de la cola (registro) para no servirlo de nuevo
+    # Eliminar el video de la cola (registro) para no servirlo de nuevo;
+    # el archivo queda en el spool marcado como servido hasta que venza la gracia,
+    # y mientras tanto se puede reanudar la descarga en /videos/<video_filename>
+    if spool_entry:
+        spool_entry.served_at = time.time()
     db.session.delete(video_meta)
     db.session.commit()
+    enforce_spool_budget()
 
     return resp
 
 
-if __name__ == "__main__":
+# --- Endpoint para reanudar la descarga de un video ya servido ---
+@app.route('/videos/<string:video_filename>', methods=['GET'])
+def resume_video(video_filename):
+    spool_entry = SpoolEntry.query.get(os.path.basename(video_filename))
+    video_filepath = os.path.join(output_dir, os.path.basename(video_filename))
+    if not spool_entry or not os.path.exists(video_filepath):
+        return jsonify({"message": "Archivo de video no encontrado"}), 404
+    return send_video_file(video_filepath, spool_entry)
+
+
+# --- Arranque ---
+_services_started = False
+_services_lock = threading.Lock()
+
+
+def start_services():
+    """
+    Migra la BD y lanza el hilo de captura, una sola vez por proceso
+    (tanto con `python test_video_server.py` como bajo un servidor WSGI).
+    """
+    global _services_started
+    with _services_lock:
+        if _services_started:
+            return
+        _services_started = True
     init_db()
     video_thread = threading.Thread(target=capture_stream, daemon=True)
     video_thread.start()
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+
+
+def create_app():
+    """
+    Fábrica para servidores WSGI. Con gunicorn los videos se envían con os.sendfile:
+        cd test && gunicorn -w 1 --threads 8 -b 0.0.0.0:5000 'test_video_server:create_app()'
+    Un solo proceso (-w 1): cada proceso arrancaría su propio hilo de captura;
+    --threads permite varias descargas a la vez.
+    """
+    start_services()
+    return app
+
+
+if __name__ == "__main__":
+    start_services()
+    # Sin debug: el recargador lanzaría un segundo hilo de captura. Con threaded=True una
+    # descarga lenta no bloquea al resto. Este servidor no usa sendfile; ver create_app.
+    app.run(host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
@@ -0,0 +1,120 @@
+import argparse
+import sys
+import os
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ai_model import AIModelFactory  # noqa: E402
+from trackers import IoUTracker, iou_matrix  # noqa: E402
+
+VEHICLE_CLASSES = {"car", "truck", "bus", "motorcycle", "van"}
+
+
+def read_frames(video_path: str, width: int, height: int, frame_skip: int, max_frames: int):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video: {video_path}")
+    frames = []
+    frame_id = 0
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if frame_id % frame_skip == 0:
+            frames.append(cv2.resize(frame, (width, height), interpolation=cv2.INTER_LINEAR))
+        frame_id += 1
+    cap.release()
+    return frames
+
+
+def run_builtin(model, frames):
+    vehicle_ids = [i for i, name in model.names.items() if name in VEHICLE_CLASSES]
+    per_frame = []
+    started = time.perf_counter()
+    for frame in frames:
+        boxes = model.track(frame, persist=True, verbose=False)[0].boxes
+        if boxes is None or boxes.id is None:
+            per_frame.append((np.empty((0, 4)), np.empty(0, dtype=int)))
+            continue
+        keep = np.isin(boxes.cls.cpu().numpy().astype(int), vehicle_ids)
+        per_frame.append((boxes.xyxy.cpu().numpy()[keep], boxes.id.int().cpu().numpy()[keep]))
+    return per_frame, time.perf_counter() - started
+
+
+def run_iou(model, frames):
+    vehicle_ids = [i for i, name in model.names.items() if name in VEHICLE_CLASSES]
+    tracker = IoUTracker()
+    per_frame = []
+    tracker_time = 0.0
+    started = time.perf_counter()
+    for frame in frames:
+        boxes = model.predict(frame, verbose=False)[0].boxes
+        classes = boxes.cls.cpu().numpy().astype(int)
+        keep = np.isin(classes, vehicle_ids)
+        xyxy = boxes.xyxy.cpu().numpy()[keep]
+        t0 = time.perf_counter()
+        ids = tracker.update(xyxy, boxes.conf.cpu().numpy()[keep], classes[keep])
+        tracker_time += time.perf_counter() - t0
+        confirmed = ids >= 0
+        per_frame.append((xyxy[confirmed], ids[confirmed]))
+    return per_frame, time.perf_counter() - started, tracker_time
+
+
+def track_stats(per_frame, gap: int = 5, iou_threshold: float = 0.3) -> dict:
+    """
+    Without ground-truth identities, counts ID switches as fragments: a new id whose
+    first box overlaps the last box of a track that ended within `gap` frames.
+    """
+    first_seen, last_seen = {}, {}
+    for i, (boxes, ids) in enumerate(per_frame):
+        for box, track_id in zip(boxes, ids):
+            first_seen.setdefault(int(track_id), (i, box))
+            last_seen[int(track_id)] = (i, box)
+
+    switches = 0
+    for track_id, (start, box) in first_seen.items():
+        ended = [(end, b) for other, (end, b) in last_seen.items()
+                 if other != track_id and start - gap <= end < start]
+        if ended and iou_matrix(box[None], np.array([b for _, b in ended])).max() >= iou_threshold:
+            switches += 1
+
+    lengths = [last_seen[t][0] - first_seen[t][0] + 1 for t in first_seen]
+    return {
+        "tracks": len(first_seen),
+        "mean_length": float(np.mean(lengths)) if lengths else 0.0,
+        "id_switches": switches,
+        "id_switch_rate": switches / len(first_seen) if first_seen else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Ultralytics model.track with the NumPy IoUTracker")
+    parser.add_argument("video_path")
+    parser.add_argument("--model", default="yolo11n.pt")
+    parser.add_argument("--width", type=int, default=320)
+    parser.add_argument("--height", type=int, default=240)
+    parser.add_argument("--frame-skip", type=int, default=1)
+    parser.add_argument("--max-frames", type=int, default=900)
+    args = parser.parse_args()
+
+    frames = read_frames(args.video_path, args.width, args.height, args.frame_skip, args.max_frames)
+    print(f"{len(frames)} frames at {args.width}x{args.height}, frame_skip={args.frame_skip}")
+
+    # separate model instances: model.track attaches tracker callbacks to its predictor
+    builtin_frames, builtin_time = run_builtin(AIModelFactory.create_model("yolo", args.model), frames)
+    iou_frames, iou_time, iou_tracker_time = run_iou(AIModelFactory.create_model("yolo", args.model), frames)
+
+    for name, per_frame, elapsed in (("ultralytics", builtin_frames, builtin_time), ("iou", iou_frames, iou_time)):
+        stats = track_stats(per_frame)
+        print(f"{name:12s} {len(frames) / elapsed:7.1f} fps  tracks={stats['tracks']:4d}  "
+              f"mean_length={stats['mean_length']:6.1f}  id_switches={stats['id_switches']:3d} "
+              f"({stats['id_switch_rate']:.1%})")
+    print(f"IoUTracker.update: {iou_tracker_time / max(len(frames), 1) * 1000:.3f} ms/frame")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import numpy as np
+
+try:
+    import lap
+except ImportError:
+    lap = None
+    from scipy.optimize import linear_sum_assignment
+
+
+class Tracker:
+    """
+    Tracker interface used by TrafficDetector when detection and tracking are decoupled.
+
+    Trackers keep their own state, so a model can be shared (or batched) between
+    clips and workers while each clip gets a fresh tracker.
+    """
+
+    def reset(self):
+        raise NotImplementedError
+
+    def update(self, xyxy: np.ndarray, scores: np.ndarray, classes: np.ndarray) -> np.ndarray:
+        """
+        Associates this frame's detections with existing tracks.
+
+        Args:
+            xyxy: (N, 4) boxes as x1, y1, x2, y2.
+            scores: (N,) detection confidences.
+            classes: (N,) class ids.
+
+        Returns:
+            (N,) array of track ids, -1 for detections not (yet) assigned to a confirmed track.
+        """
+        raise NotImplementedError
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of (M, 4) and (N, 4) xyxy boxes."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def linear_assignment(cost: np.ndarray, cost_limit: float) -> list:
+    """
+    Minimum-cost matching, ignoring pairs costlier than cost_limit.
+
+    Returns:
+        A list of (row, col) pairs.
+    """
+    if cost.size == 0:
+        return []
+    if lap is not None:
+        _, x, _ = lap.lapjv(cost, extend_cost=True, cost_limit=cost_limit)
+        return [(i, j) for i, j in enumerate(x) if j >= 0]
+    rows, cols = linear_sum_assignment(cost)
+    return [(i, j) for i, j in zip(rows, cols) if cost[i, j] <= cost_limit]
+
+
+class IoUTracker(Tracker):
+    """
+    Lightweight IoU/centroid tracker.
+
+    Tracks are predicted forward with their last displacement, matched to
+    detections by IoU, and unmatched leftovers are matched by centroid distance
+    (normalised by box size) so fast vehicles survive sparse frame sampling.
+
+    Attributes:
+        iou_threshold: Minimum IoU for a match in the first pass.
+        centroid_threshold: Maximum centroid distance, in box diagonals, for the second pass.
+        max_age: Frames a track may go unmatched before it is dropped.
+        min_hits: Matches needed before a track's id is reported.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, centroid_threshold: float = 1.0, max_age: int = 10,
+                 min_hits: int = 1):
+        self.iou_threshold = iou_threshold
+        self.centroid_threshold = centroid_threshold
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.reset()
+
+    def reset(self):
+        self._next_id = 1
+        self.boxes = np.empty((0, 4))
+        self.velocities = np.empty((0, 4))
+        self.ids = np.empty(0, dtype=np.int64)
+        self.hits = np.empty(0, dtype=np.int64)
+        self.misses = np.empty(0, dtype=np.int64)
+
+    def update(self, xyxy: np.ndarray, scores: np.ndarray, classes: np.ndarray) -> np.ndarray:
+        xyxy = np.asarray(xyxy, dtype=np.float64).reshape(-1, 4)
+        predicted = self.boxes + self.velocities * (self.misses[:, None] + 1)
+
+        matches = linear_assignment(1.0 - iou_matrix(predicted, xyxy), 1.0 - self.iou_threshold)
+        unmatched_tracks = np.setdiff1d(np.arange(len(predicted)), [t for t, _ in matches])
+        unmatched_dets = np.setdiff1d(np.arange(len(xyxy)), [d for _, d in matches])
+
+        if len(unmatched_tracks) and len(unmatched_dets):
+            tracks_c = (predicted[unmatched_tracks, :2] + predicted[unmatched_tracks, 2:]) / 2
+            dets_c = (xyxy[unmatched_dets, :2] + xyxy[unmatched_dets, 2:]) / 2
+            diag = np.hypot(*(predicted[unmatched_tracks, 2:] - predicted[unmatched_tracks, :2]).T)
+            dist = np.linalg.norm(tracks_c[:, None] - dets_c[None], axis=2) / np.maximum(diag[:, None], 1e-6)
+            for t, d in linear_assignment(dist, self.centroid_threshold):
+                matches.append((unmatched_tracks[t], unmatched_dets[d]))
+            unmatched_dets = np.setdiff1d(np.arange(len(xyxy)), [d for _, d in matches])
+
+        out = np.full(len(xyxy), -1, dtype=np.int64)
+        self.misses += 1
+        for t, d in matches:
+            steps = self.misses[t]
+            self.velocities[t] = (xyxy[d] - self.boxes[t]) / steps
+            self.boxes[t] = xyxy[d]
+            self.hits[t] += 1
+            self.misses[t] = 0
+            if self.hits[t] >= self.min_hits:
+                out[d] = self.ids[t]
+
+        # start new tracks for the remaining detections
+        n_new = len(unmatched_dets)
+        new_ids = np.arange(self._next_id, self._next_id + n_new)
+        self._next_id += n_new
+        self.boxes = np.vstack([self.boxes, xyxy[unmatched_dets]])
+        self.velocities = np.vstack([self.velocities, np.zeros((n_new, 4))])
+        self.ids = np.concatenate([self.ids, new_ids])
+        self.hits = np.concatenate([self.hits, np.ones(n_new, dtype=np.int64)])
+        self.misses = np.concatenate([self.misses, np.zeros(n_new, dtype=np.int64)])
+        if self.min_hits <= 1:
+            out[unmatched_dets] = new_ids
+
+        alive = self.misses <= self.max_age
+        self.boxes, self.velocities = self.boxes[alive], self.velocities[alive]
+        self.ids, self.hits, self.misses = self.ids[alive], self.hits[alive], self.misses[alive]
+        return out
+
+
+def reset_builtin_tracker(model):
+    """
+    Clears the tracker state model.track(persist=True) keeps on the model's predictor.
+    """
+    predictor = getattr(model, "predictor", None)
+    for tracker in getattr(predictor, "trackers", None) or []:
+        tracker.reset()
+
+
+def create_tracker(name: str):
+    """
+    Returns a Tracker for `name`, or None for Ultralytics' built-in model.track.
+    """
+    if name == "ultralytics":
+        return None
+    if name == "iou":
+        return IoUTracker()
+    raise ValueError(f"Unsupported tracker: {name}")
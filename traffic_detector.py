@@ -2,15 +2,43 @@ import datetime
 from collections import defaultdict
 
 import cv2
+import numpy as np
 
-from models import Line
+from detection_cache import DetectionRecorder, load_detections, iter_frames
+from event_log import CrossingEventLog
+from geometry import CameraGeometry
+from models import Line, LineZone, PolygonZone
+from trackers import Tracker
+from zones import START
+
+
+class _ZoneState:
+    """Per-zone counting state."""
+
+    def __init__(self, ref_distance: float):
+        self.ref_distance = ref_distance
+        # store timestamps for start-first or finish-first crossings
+        self.start_times = {}
+        self.finish_times = {}
+        # polygon zones: track id -> entry time of the tracks currently inside
+        self.inside = {}
+        # track id -> time of its last counted finish crossing
+        self.last_counted = {}
+        self.vehicle_count = 0
+        self.speeds = []
+
+    def result(self) -> dict:
+        avg_speed = sum(self.speeds) / len(self.speeds) if self.speeds else 0.0
+        return {"vehicle_count": self.vehicle_count, "average_speed": avg_speed}
 
 
 class TrafficDetector:
     def __init__(self, video_path: str, model, start_ref_line: Line, finish_ref_line: Line, ref_distance: int,
-                 track_orientation: str, show_video: bool = False, cooldown_duration: float = 2.0,
+                 track_orientation: str, show_video: bool = False, cooldown_duration: float = 0.0,
                  frame_skip: int = 1, vehicle_classes: set = None, target_width: int = 1280,
-                 target_height: int = 720):
+                 target_height: int = 720, inference_size: int = None, zones: list = None,
+                 tracker: Tracker = None, preview=None, detections_path: str = None,
+                 decoder_threads: int = None, geometry: CameraGeometry = None, clip_metadata: dict = None):
         self.video_path = video_path
         self.model = model
         self.start_ref_line = start_ref_line
@@ -23,12 +51,46 @@ class TrafficDetector:
         self.frame_skip = frame_skip
         self.target_width = target_width
         self.target_height = target_height
+        self.inference_size = inference_size
+        # None keeps Ultralytics' built-in model.track; otherwise detections come from
+        # model.predict and are associated by this tracker, which owns all tracking state
+        self.tracker = tracker
+        # optional PreviewChannel; frames are only annotated while it has viewers
+        self.preview = preview
+        # optional .npy file receiving every tracked detection, for replay() with new geometry;
+        # clip_metadata is saved alongside so the clip can be recounted once the video is deleted
+        self.recorder = DetectionRecorder(detections_path, clip_metadata) if detections_path else None
+        # FFmpeg decoding threads; None lets OpenCV use every core
+        self.decoder_threads = decoder_threads
+        self._set_class_names(model.names if model is not None else {})
         self.track_history = defaultdict(list)
-        # store timestamps for start-first or finish-first crossings
-        self.start_times = {}
-        self.finish_times = {}
-        self.vehicle_count = 0
-        self.speeds = []
+        # lines, zones, ROI and calibration; normally shared by all clips of the camera via GeometryCache
+        self.geometry = geometry or CameraGeometry(None, start_ref_line, finish_ref_line, ref_distance, zones=zones,
+                                                   width=target_width, height=target_height)
+        # zone 0 is the camera-wide start/finish pair, followed by the configured zones
+        self.zones = self.geometry.zones
+        self.zone_set = self.geometry.zone_set
+        self.zone_states = [_ZoneState(d) for d in self.geometry.ref_distances]
+        self.track_classes = {}
+        self.event_log = CrossingEventLog()
+        self.video_start_time = None
+
+    def config_fingerprint(self, model_name: str) -> dict:
+        """
+        Everything besides the clip itself that affects the result, for use as a cache key.
+        """
+        return {
+            "model": model_name,
+            **self.geometry.fingerprint(),
+            "ref_distance": self.ref_distance,
+            "track_orientation": self.track_orientation,
+            "cooldown_duration": self.cooldown_duration,
+            "vehicle_classes": sorted(self.vehicle_classes),
+            "frame_skip": self.frame_skip,
+            "resolution": [self.target_width, self.target_height],
+            "inference_size": self.inference_size,
+            "tracker": type(self.tracker).__name__ if self.tracker is not None else "ultralytics",
+        }
 
     @staticmethod
     def compute_speed(start_time: datetime.datetime, finish_time: datetime.datetime,
@@ -52,8 +114,25 @@ class TrafficDetector:
         val2 = (bx - ax) * (p2[1] - ay) - (by - ay) * (p2[0] - ax)
         return val1 * val2 < 0
 
+    def _offset(self, t: datetime.datetime) -> float:
+        return (t - self.video_start_time).total_seconds()
+
+    def _record_crossing(self, zone_id: int, track_id: int, start_t: datetime.datetime = None,
+                         finish_t: datetime.datetime = None, speed: float = float("nan")):
+        self.event_log.append(
+            track_id=track_id,
+            class_id=self.track_classes.get(track_id, -1),
+            zone_id=zone_id,
+            start_time=self._offset(start_t) if start_t is not None else float("nan"),
+            finish_time=self._offset(finish_t) if finish_t is not None else float("nan"),
+            speed=speed
+        )
+
     def process_video(self) -> dict:
-        cap = cv2.VideoCapture(self.video_path)
+        if self.decoder_threads:
+            cap = cv2.VideoCapture(self.video_path, cv2.CAP_FFMPEG, [cv2.CAP_PROP_N_THREADS, self.decoder_threads])
+        else:
+            cap = cv2.VideoCapture(self.video_path)
         if not cap.isOpened():
             raise IOError(f"Video file not found or cannot be opened!, video path: {self.video_path}" )
 
@@ -67,6 +146,9 @@ class TrafficDetector:
 
 
         video_start_time = datetime.datetime.now()
+        self.video_start_time = video_start_time
+        if self.tracker is not None:
+            self.tracker.reset()
         frame_id = 0
 
         while cap.isOpened():
@@ -77,72 +159,20 @@ class TrafficDetector:
                 frame_id += 1
                 continue
             frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
-            results = self.model.track(frame, persist=True)
-            annotated = frame.copy()
-
-            # draw start (green) and finish (red) lines
-            cv2.line(annotated,
-                     (int(self.start_ref_line.A.x), int(self.start_ref_line.A.y)),
-                     (int(self.start_ref_line.B.x), int(self.start_ref_line.B.y)),
-                     (0, 255, 0), 2)
-            cv2.line(annotated,
-                     (int(self.finish_ref_line.A.x), int(self.finish_ref_line.A.y)),
-                     (int(self.finish_ref_line.B.x), int(self.finish_ref_line.B.y)),
-                     (0, 0, 255), 2)
-
-            current_time = video_start_time + datetime.timedelta(seconds=frame_id / fps)
-
-            if results[0].boxes is not None and results[0].boxes.id is not None:
-                boxes = results[0].boxes.xywh.cpu()  # center_x, center_y, w, h
-                ids = results[0].boxes.id.int().cpu().tolist()
-                classes = results[0].boxes.cls.cpu().tolist()
-
-                for box, track_id, cls in zip(boxes, ids, classes):
-                    label = self.model.names[int(cls)]
-                    if label not in self.vehicle_classes:
-                        continue
-
-                    cx, cy, w, h = map(float, box)
-                    # compute corners
-                    x1 = int(cx - w / 2)
-                    y1 = int(cy - h / 2)
-                    x2 = int(cx + w / 2)
-                    y2 = int(cy + h / 2)
-
-                    if self.show_video:
-                        cv2.rectangle(annotated, (x1, y1), (x2, y2), (230, 230, 230), 1)
-                        cv2.putText(annotated, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX,
-                                    0.6, (230, 230, 230), 2)
-
-                    # update track history
-                    hist = self.track_history[track_id]
-                    hist.append((cx, cy))
-                    if len(hist) > 30:
-                        hist.pop(0)
-
-                    crossed_start = self.has_vehicle_crossed_line(self.start_ref_line, hist)
-                    crossed_finish = self.has_vehicle_crossed_line(self.finish_ref_line, hist)
-
-                    # when crossing start line
-                    if crossed_start:
-                        if track_id in self.finish_times:
-                            finish_t = self.finish_times.pop(track_id)
-                            speed = self.compute_speed(current_time, finish_t, self.ref_distance)
-                            self.speeds.append(speed)
-                        elif track_id not in self.start_times:
-                            self.start_times[track_id] = current_time
-
-                    # when crossing finish line, count always
-                    if crossed_finish:
-                        self.vehicle_count += 1
-                        if track_id in self.start_times:
-                            start_t = self.start_times.pop(track_id)
-                            speed = self.compute_speed(start_t, current_time, self.ref_distance)
-                            self.speeds.append(speed)
-                        elif track_id not in self.finish_times:
-                            self.finish_times[track_id] = current_time
+            boxes, ids, classes = self._detect(frame)
+            render = self.show_video or (self.preview is not None and self.preview.want_frame())
+            annotated = frame.copy() if render else None
+
+            if render:
+                self._draw_zones(annotated)
+
+            if self.recorder is not None:
+                self.recorder.add(frame_id, boxes, ids, classes)
+            self._update_tracks(frame_id / fps, boxes, ids, classes, annotated)
 
             frame_id += 1
+            if render and self.preview is not None:
+                self.preview.publish(annotated)
             if self.show_video:
                 cv2.imshow("Traffic", annotated)
                 if cv2.waitKey(1) & 0xFF == ord('q'):
@@ -151,6 +181,199 @@ class TrafficDetector:
         cap.release()
         if self.show_video:
             cv2.destroyAllWindows()
+        if self.recorder is not None:
+            self.recorder.save(fps, (new_w, new_h), self.frame_skip, self.class_names)
 
-        avg_speed = sum(self.speeds) / len(self.speeds) if self.speeds else 0.0
-        return {"vehicle_count": self.vehicle_count, "average_speed": avg_speed}
+        return self._result()
+
+    def replay(self, detections_path: str) -> dict:
+        """
+        Recomputes counts and speeds from detections saved by a previous run
+        (see detections_path), using this detector's lines, zones and ref_distance.
+        No model is needed; frames are not decoded.
+        """
+        rows, metadata = load_detections(detections_path)
+        if tuple(metadata["frame_size"]) != (self.target_width, self.target_height):
+            # lines are in pixels of the resized frame, so boxes must share its size
+            raise ValueError(f"Detections were recorded at {metadata['frame_size']}, "
+                             f"not {self.target_width}x{self.target_height}")
+        self._set_class_names(metadata["class_names"])
+        fps = metadata["fps"]
+        self.video_start_time = datetime.datetime.now()
+        for frame_id, boxes, ids, classes in iter_frames(rows):
+            self._update_tracks(frame_id / fps, boxes, ids, classes)
+        return self._result()
+
+    def _update_tracks(self, frame_time: float, boxes, ids: list, classes: list, annotated=None):
+        """
+        Adds one frame's tracked vehicles to their histories and evaluates the zones.
+
+        Args:
+            frame_time: Seconds since the start of the clip.
+            boxes: Boxes as center_x, center_y, w, h.
+            ids: Track ids.
+            classes: Class ids.
+            annotated: Frame to draw the boxes on, or None when not rendering.
+        """
+        current_time = self.video_start_time + datetime.timedelta(seconds=frame_time)
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        classes = np.asarray(classes, dtype=np.int64)
+        # class and ROI filters for the whole frame at once
+        keep = np.isin(classes, self.vehicle_class_ids)
+        if self.geometry.roi_mask is not None:
+            keep &= self.geometry.in_roi(boxes[:, :2])
+        keep = np.flatnonzero(keep)
+
+        frame_tracks = []
+        for (cx, cy, w, h), track_id, cls in zip(boxes[keep].tolist(), np.asarray(ids)[keep].tolist(),
+                                                 classes[keep].tolist()):
+            if annotated is not None:
+                # compute corners
+                x1 = int(cx - w / 2)
+                y1 = int(cy - h / 2)
+                x2 = int(cx + w / 2)
+                y2 = int(cy + h / 2)
+                cv2.rectangle(annotated, (x1, y1), (x2, y2), (230, 230, 230), 1)
+                cv2.putText(annotated, self.class_names[cls], (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX,
+                            0.6, (230, 230, 230), 2)
+
+            self.track_classes[track_id] = cls
+
+            # update track history (position and seconds since clip start)
+            hist = self.track_history[track_id]
+            hist.append((cx, cy, frame_time))
+            if len(hist) > 30:
+                hist.pop(0)
+            frame_tracks.append(track_id)
+
+        self._update_zones(frame_tracks, current_time)
+
+    def _set_class_names(self, class_names: dict):
+        self.class_names = class_names
+        self.vehicle_class_ids = np.array([i for i, name in class_names.items() if name in self.vehicle_classes],
+                                          dtype=np.int64)
+
+    def _detect(self, frame) -> tuple:
+        """
+        Runs detection and tracking on one frame.
+
+        Returns:
+            A (boxes as center_x, center_y, w, h, track ids, class ids) tuple.
+        """
+        kwargs = {"imgsz": self.inference_size} if self.inference_size else {}
+        if self.tracker is None:
+            results = self.model.track(frame, persist=True, **kwargs)
+            if results[0].boxes is None or results[0].boxes.id is None:
+                return [], [], []
+            return (results[0].boxes.xywh.cpu(),  # center_x, center_y, w, h
+                    results[0].boxes.id.int().cpu().tolist(),
+                    results[0].boxes.cls.cpu().tolist())
+
+        results = self.model.predict(frame, verbose=False, **kwargs)
+        if results[0].boxes is None:
+            return [], [], []
+        xyxy = results[0].boxes.xyxy.cpu().numpy()
+        scores = results[0].boxes.conf.cpu().numpy()
+        classes = results[0].boxes.cls.cpu().numpy().astype(int)
+        # only vehicles are handed to the tracker
+        keep = np.isin(classes, self.vehicle_class_ids)
+        xyxy, scores, classes = xyxy[keep], scores[keep], classes[keep]
+        ids = self.tracker.update(xyxy, scores, classes)
+        confirmed = ids >= 0
+        xyxy, ids, classes = xyxy[confirmed], ids[confirmed], classes[confirmed]
+        xywh = np.column_stack([(xyxy[:, :2] + xyxy[:, 2:]) / 2, xyxy[:, 2:] - xyxy[:, :2]])
+        return xywh, ids.tolist(), classes.tolist()
+
+    def _result(self) -> dict:
+        for zone_id, state in enumerate(self.zone_states):
+            # vehicles seen only at the finish line are counted but have no speed
+            for track_id, finish_t in state.finish_times.items():
+                self._record_crossing(zone_id, track_id, finish_t=finish_t)
+            # vehicles still inside a polygon zone when the clip ends
+            for track_id, entry_t in state.inside.items():
+                self._record_crossing(zone_id, track_id, start_t=entry_t)
+
+        result = self.zone_states[0].result()
+        result["events"] = self.event_log
+        if len(self.zones) > 1:
+            result["zones"] = {}
+            for zone, state in zip(self.zones[1:], self.zone_states[1:]):
+                zone_result = state.result()
+                if isinstance(zone, PolygonZone):
+                    del zone_result["average_speed"]
+                result["zones"][zone.name] = zone_result
+        return result
+
+    def _update_zones(self, track_ids: list, current_time: datetime.datetime):
+        """
+        Evaluates every zone against every track seen in this frame in one vectorized pass.
+        """
+        if not track_ids:
+            return
+        moving = [t for t in track_ids if len(self.track_history[t]) >= 2]
+        if moving and len(self.zone_set.lines):
+            prev = np.array([self.track_history[t][-2] for t in moving], dtype=np.float64)
+            cur = np.array([self.track_history[t][-1] for t in moving], dtype=np.float64)
+            crossed, fraction = self.zone_set.crossings(prev[:, :2], cur[:, :2])
+            for track_idx, line_idx in zip(*np.nonzero(crossed)):
+                zone_id, role = self.zone_set.line_owner[line_idx]
+                # interpolate the crossing time between the two straddling track points,
+                # so the error no longer grows with frame_skip
+                t1, t2 = prev[track_idx, 2], cur[track_idx, 2]
+                crossing_time = self.video_start_time + datetime.timedelta(
+                    seconds=float(t1 + fraction[track_idx, line_idx] * (t2 - t1)))
+                if role == START:
+                    self._on_start_crossed(int(zone_id), moving[track_idx], crossing_time)
+                else:
+                    self._on_finish_crossed(int(zone_id), moving[track_idx], crossing_time)
+
+        if len(self.zone_set.polygons):
+            points = np.array([self.track_history[t][-1][:2] for t in track_ids], dtype=np.float64)
+            inside = self.zone_set.contains(points)
+            for poly_idx, zone_id in enumerate(self.zone_set.polygon_owner):
+                state = self.zone_states[zone_id]
+                for track_id, is_inside in zip(track_ids, inside[:, poly_idx]):
+                    if is_inside and track_id not in state.inside:
+                        state.inside[track_id] = current_time
+                        state.vehicle_count += 1
+                    elif not is_inside and track_id in state.inside:
+                        entry_t = state.inside.pop(track_id)
+                        self._record_crossing(int(zone_id), track_id, entry_t, current_time)
+
+    def _on_start_crossed(self, zone_id: int, track_id: int, current_time: datetime.datetime):
+        state = self.zone_states[zone_id]
+        if track_id in state.finish_times:
+            finish_t = state.finish_times.pop(track_id)
+            speed = self.compute_speed(current_time, finish_t, state.ref_distance)
+            state.speeds.append(speed)
+            self._record_crossing(zone_id, track_id, current_time, finish_t, speed)
+        elif track_id not in state.start_times:
+            state.start_times[track_id] = current_time
+
+    def _on_finish_crossed(self, zone_id: int, track_id: int, current_time: datetime.datetime):
+        # when crossing finish line, count always, unless cooldown_duration is set (opt-in,
+        # 0 disables it) and the same track was counted within it (a box jittering over the line)
+        state = self.zone_states[zone_id]
+        last_counted = state.last_counted.get(track_id)
+        if (self.cooldown_duration > 0 and last_counted is not None
+                and (current_time - last_counted).total_seconds() < self.cooldown_duration):
+            return
+        state.last_counted[track_id] = current_time
+        state.vehicle_count += 1
+        if track_id in state.start_times:
+            start_t = state.start_times.pop(track_id)
+            speed = self.compute_speed(start_t, current_time, state.ref_distance)
+            state.speeds.append(speed)
+            self._record_crossing(zone_id, track_id, start_t, current_time, speed)
+        elif track_id not in state.finish_times:
+            state.finish_times[track_id] = current_time
+
+    def _draw_zones(self, annotated):
+        # draw start (green) and finish (red) lines, polygon zones in yellow
+        for zone in self.zones:
+            if isinstance(zone, LineZone):
+                for line, color in ((zone.start_line, (0, 255, 0)), (zone.finish_line, (0, 0, 255))):
+                    cv2.line(annotated, (int(line.A.x), int(line.A.y)), (int(line.B.x), int(line.B.y)), color, 2)
+            else:
+                pts = np.array([(p.x, p.y) for p in zone.points], dtype=np.int32)
+                cv2.polylines(annotated, [pts], True, (0, 255, 255), 2)
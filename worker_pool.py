@@ -1,31 +1,73 @@
 import asyncio
 import concurrent.futures
+import os
 from ai_model import AIModelFactory
-from data_storage import send_to_data_server
+from data_storage import send_to_data_server, send_events_to_data_server
 from traffic_detector import TrafficDetector
 from models import Video
 from models import Resolution
+from scheduler import FairVideoScheduler
+from spool import VideoSpool
+from result_cache import ResultCache, file_sha256
+from trackers import create_tracker
+from preview import PreviewServer
+from cpu_budget import CpuBudget, CpuPlan
+from geometry import GeometryCache
+from detection_cache import DetectionStore
 
+MODEL_PATH = "yolo11n.pt"
 
-async def video_worker(worker_id: int, video_queue: asyncio.Queue, executor: concurrent.futures.Executor) -> None:
+
+async def video_worker(worker_id: int, video_queue: FairVideoScheduler, executor: concurrent.futures.Executor,
+                       spool: VideoSpool = None, result_cache: ResultCache = None,
+                       tracker: str = "ultralytics", preview_server: PreviewServer = None,
+                       decoder_threads: int = None, geometry_cache: GeometryCache = None,
+                       detection_store: DetectionStore = None) -> None:
     """
     Worker coroutine that continuously processes videos from the queue.
 
     Creates its own YOLO model instance and waits for Video objects to process.
-    After processing, sends the result via an HTTP PUT request.
+    Each clip comes with a ProcessingPlan from the scheduler: stale clips are
+    reported as skipped, late clips are processed with a cheaper frame_skip
+    and inference size. After processing, sends the result and the
+    per-vehicle crossing events to the data server, then releases the clip
+    from the spool once the upload succeeded; clips the spool evicted while
+    queued are reported as skipped. Clips already processed with the
+    same detection config are answered from the result cache.
 
     Args:
         worker_id: The ID of the worker.
-        video_queue: The asyncio queue containing Video objects.
+        video_queue: The scheduler handing out (Video, ProcessingPlan) pairs.
         executor: The ThreadPoolExecutor to run blocking video processing tasks.
+        spool: Optional VideoSpool owning the downloaded clip files.
+        result_cache: Optional ResultCache keyed by clip content and detection config.
+        tracker: "ultralytics" for model.track, or "iou" for a fresh IoUTracker per clip.
+        preview_server: Optional PreviewServer publishing the annotated output per camera.
+        decoder_threads: FFmpeg decoding threads per clip, from the VideoProcessor's CPU budget.
+        geometry_cache: Optional GeometryCache sharing each camera's precomputed geometry across clips.
+        detection_store: Optional DetectionStore receiving each processed clip's tracked detections,
+            so it can be recounted with `backfill.py --replay` after a geometry change.
     """
     loop = asyncio.get_running_loop()
-    local_model = AIModelFactory.create_model("yolo", "yolo11n.pt")
+    local_model = AIModelFactory.create_model("yolo", MODEL_PATH)
     while True:
-        video_obj: Video = await video_queue.get()
+        video_obj, plan = await video_queue.get()
+        uploaded = False
         try:
+            if plan.skip:
+                result = {"status": "skipped", "reason": f"stale after {plan.age:.0f}s",
+                          "vehicle_count": None, "average_speed": 0.0}
+                uploaded = await send_to_data_server(video_obj, result)
+                continue
+            if not os.path.exists(video_obj.video_path):
+                # evicted from the spool while queued
+                result = {"status": "skipped", "reason": "evicted from spool",
+                          "vehicle_count": None, "average_speed": 0.0}
+                uploaded = await send_to_data_server(video_obj, result)
+                continue
             print(
                 f"Worker {worker_id}: Received video from camera {video_obj.traffic_cam_id} with file '{video_obj.video_path}'")
+            video_filename = os.path.basename(video_obj.video_path)
             detector = TrafficDetector(
                 video_path=video_obj.video_path,
                 model=local_model,
@@ -34,23 +76,61 @@ async def video_worker(worker_id: int, video_queue: asyncio.Queue, executor: con
                 finish_ref_line=video_obj.finish_ref_line,
                 ref_distance=video_obj.ref_distance,
                 track_orientation=video_obj.track_orientation,
+                zones=video_obj.zones,
+                tracker=create_tracker(tracker),
 
                 # visualization / filtering
-                show_video=True,
-                cooldown_duration=2.0,
+                show_video=False,
+                preview=preview_server.channel(video_obj.traffic_cam_id) if preview_server else None,
+                # repeated finish-line counts are kept until evaluate.py has measured the cooldown
+                cooldown_duration=0.0,
                 vehicle_classes={"car", "truck", "bus", "motorcycle", "van"},
-                frame_skip=1,
+                frame_skip=plan.frame_skip,
 
                 # output resolution
                 target_width=Resolution.Default.width,
-                target_height=Resolution.Default.height
+                target_height=Resolution.Default.height,
+                inference_size=plan.inference_size,
+                decoder_threads=decoder_threads,
+                geometry=geometry_cache.get(video_obj, Resolution.Default.width, Resolution.Default.height)
+                if geometry_cache else None,
+                detections_path=detection_store.path_for(video_filename) if detection_store else None,
+                clip_metadata={"video_filename": video_filename, "traffic_cam_id": video_obj.traffic_cam_id,
+                               "start_time": video_obj.start_datetime.timestamp(),
+                               "end_time": video_obj.end_datetime.timestamp()}
             )
-            result = await loop.run_in_executor(executor, detector.process_video)
+            result = None
+            cache_key = None
+            if result_cache is not None:
+                content_sha256 = video_obj.content_sha256 or await loop.run_in_executor(
+                    executor, file_sha256, video_obj.video_path)
+                cache_key = result_cache.make_key(content_sha256, detector.config_fingerprint(MODEL_PATH))
+                result = result_cache.get(cache_key)
+                print(f"Worker {worker_id}: Result cache {'hit' if result is not None else 'miss'} "
+                      f"for '{video_obj.video_path}' ({result_cache.stats()})")
+            if result is None:
+                result = await loop.run_in_executor(executor, detector.process_video)
+                if cache_key is not None:
+                    result_cache.put(cache_key, result)
             print(f"Worker {worker_id}: Finished processing video from camera {video_obj.traffic_cam_id}, result: {result}")
-            await send_to_data_server(video_obj, result)
+            # the clip is only released once both the summary and its events arrived
+            uploaded = await send_to_data_server(video_obj, result)
+            uploaded = await send_events_to_data_server(video_obj, result["events"]) and uploaded
+            if detection_store is not None:
+                # housekeeping only: a failure here must not affect the clip's upload state
+                try:
+                    await loop.run_in_executor(executor, detection_store.add,
+                                               detection_store.path_for(video_filename))
+                except Exception as e:
+                    print(f"Worker {worker_id}: Could not index recorded detections: {e}")
         except Exception as e:
             print(f"Worker {worker_id}: Encountered an error: {e}")
         finally:
+            if spool is not None:
+                if uploaded:
+                    spool.release(video_obj.video_path)
+                else:
+                    spool.mark_failed(video_obj.video_path)
             video_queue.task_done()
 
 
@@ -60,15 +140,33 @@ class VideoProcessor:
 
     Attributes:
         num_workers: The number of workers to run.
-        video_queue: An asyncio queue for incoming Video objects.
+        video_queue: A FairVideoScheduler for incoming Video objects.
         executor: A ThreadPoolExecutor for running blocking video processing tasks.
+        spool: Optional VideoSpool that owns the clip files; clips are released after upload.
+        result_cache: Optional ResultCache used to skip reprocessing duplicate clips.
+        tracker: Tracker used by the workers ("ultralytics" or "iou").
+        preview_server: Optional PreviewServer for on-demand annotated MJPEG previews.
+        cpu_budget: CpuBudget splitting the cores across workers (torch, OpenCV and decoder threads).
+        geometry_cache: GeometryCache with the lines, zones, ROI and calibration of each camera.
+        detection_store: Optional DetectionStore keeping each clip's tracked detections for replay.
         workers: List of worker tasks.
     """
 
-    def __init__(self, num_workers: int=1):
+    def __init__(self, num_workers: int=1, deadline: float = 120.0, spool: VideoSpool = None,
+                 result_cache: ResultCache = None, tracker: str = "ultralytics", preview_port: int = None,
+                 preview_host: str = "127.0.0.1", cpu_budget: int = None, threads_per_worker: int = None,
+                 pin_cores: bool = False, detection_store: DetectionStore = None):
         self.num_workers = num_workers
-        self.video_queue = asyncio.Queue()
-        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=num_workers)
+        self.tracker = tracker
+        self.preview_server = PreviewServer(host=preview_host, port=preview_port) if preview_port else None
+        self.spool = spool
+        self.result_cache = result_cache
+        self.video_queue = FairVideoScheduler(deadline=deadline)
+        self.geometry_cache = GeometryCache()
+        self.detection_store = detection_store
+        # without a budget every worker's torch/OpenCV pools would size themselves to all cores
+        self.cpu_budget = CpuBudget(CpuPlan.split(num_workers, cpu_budget, threads_per_worker, pin_cores))
+        self.executor = self.cpu_budget.executor()
         self.workers = []
         self._started = False
 
@@ -77,8 +175,15 @@ class VideoProcessor:
         Starts the worker tasks if they haven't been started already.
         """
         if not self._started:
+            if self.preview_server is not None:
+                await self.preview_server.start()
             self.workers = [
-                asyncio.create_task(video_worker(worker_id=i, video_queue=self.video_queue, executor=self.executor))
+                asyncio.create_task(video_worker(worker_id=i, video_queue=self.video_queue, executor=self.executor,
+                                          spool=self.spool, result_cache=self.result_cache,
+                                          tracker=self.tracker, preview_server=self.preview_server,
+                                          decoder_threads=self.cpu_budget.plan.threads_per_worker,
+                                          geometry_cache=self.geometry_cache,
+                                          detection_store=self.detection_store))
                 for i in range(self.num_workers)
             ]
             self._started = True
@@ -91,7 +196,23 @@ class VideoProcessor:
             video_obj: A Video instance containing video metadata and file path.
         """
         await self.video_queue.put(video_obj)
-        print(f"VideoProcessor: Enqueued video from camera {video_obj.traffic_cam_id}")
+        print(f"VideoProcessor: Enqueued video from camera {video_obj.traffic_cam_id} "
+              f"({self.video_queue.qsize()} pending)")
+
+    def stats(self) -> dict:
+        """
+        Returns the scheduler's queue depths, oldest clip age and skip/degrade counters,
+        plus result cache hits and misses when a cache is configured, geometry cache
+        hits and misses, and the CPU split.
+        """
+        stats = self.video_queue.stats()
+        if self.result_cache is not None:
+            stats["result_cache"] = self.result_cache.stats()
+        stats["geometry_cache"] = self.geometry_cache.stats()
+        plan = self.cpu_budget.plan
+        stats["cpu"] = {"num_workers": plan.num_workers, "threads_per_worker": plan.threads_per_worker,
+                        "core_sets": plan.core_sets}
+        return stats
 
     async def stop(self):
         """
@@ -101,4 +222,6 @@ class VideoProcessor:
         for worker in self.workers:
             worker.cancel()
         await asyncio.gather(*self.workers, return_exceptions=True)
+        if self.preview_server is not None:
+            await self.preview_server.stop()
         self.executor.shutdown(wait=True)
@@ -0,0 +1,113 @@
+import numpy as np
+
+from models import LineZone, PolygonZone
+
+START = 0
+FINISH = 1
+
+
+class ZoneSet:
+    """
+    Packs every zone of a camera into arrays so that all zones can be tested
+    against all tracks with a handful of NumPy operations per frame.
+
+    Attributes:
+        zones: The LineZone/PolygonZone objects, indexed by zone id.
+        lines: (L, 4) array of line endpoints ax, ay, bx, by.
+        bounded: (L,) mask of lines tested as segments rather than infinite lines.
+        origins: (2, L) line start points ax, ay.
+        ends: (2, L) line end points bx, by.
+        directions: (2, L) line direction vectors bx - ax, by - ay for the cross-product test.
+        line_owner: (L, 2) array of (zone id, START/FINISH) for each line.
+        polygons: (P, V, 2) array of polygon vertices, padded by repeating the last vertex.
+        polygon_owner: (P,) array of zone ids for each polygon.
+    """
+
+    def __init__(self, zones: list):
+        self.zones = list(zones)
+        lines, bounded, line_owner = [], [], []
+        polygons, polygon_owner = [], []
+        for zone_id, zone in enumerate(self.zones):
+            if isinstance(zone, LineZone):
+                for role, line in ((START, zone.start_line), (FINISH, zone.finish_line)):
+                    lines.append((line.A.x, line.A.y, line.B.x, line.B.y))
+                    bounded.append(zone.bounded)
+                    line_owner.append((zone_id, role))
+            elif isinstance(zone, PolygonZone):
+                polygons.append([(p.x, p.y) for p in zone.points])
+                polygon_owner.append(zone_id)
+            else:
+                raise TypeError(f"Unsupported zone: {zone!r}")
+
+        self.lines = np.array(lines, dtype=np.float64).reshape(-1, 4)
+        self.bounded = np.array(bounded, dtype=bool)
+        # line equations are fixed per camera, so only the track positions vary per frame
+        self.origins = np.ascontiguousarray(self.lines[:, :2].T)
+        self.ends = np.ascontiguousarray(self.lines[:, 2:].T)
+        self.directions = np.ascontiguousarray((self.lines[:, 2:] - self.lines[:, :2]).T)
+        self.any_bounded = bool(self.bounded.any())
+        self.line_owner = np.array(line_owner, dtype=np.int64).reshape(-1, 2)
+
+        max_vertices = max((len(p) for p in polygons), default=0)
+        self.polygons = np.zeros((len(polygons), max_vertices, 2), dtype=np.float64)
+        for i, points in enumerate(polygons):
+            self.polygons[i, :len(points)] = points
+            self.polygons[i, len(points):] = points[-1]
+        self.polygon_owner = np.array(polygon_owner, dtype=np.int64)
+
+    def crossings(self, prev: np.ndarray, cur: np.ndarray) -> tuple:
+        """
+        Tests the moves prev -> cur of N tracks against all L lines at once.
+
+        A move crosses a line when its endpoints lie on opposite sides of it, i.e. the
+        cross products (B - A) x (p - A) of the two endpoints have opposite signs;
+        bounded lines additionally require the move to intersect the segment itself.
+
+        Args:
+            prev: (N, 2) previous track positions.
+            cur: (N, 2) current track positions.
+
+        Returns:
+            A ((N, L) boolean matrix of crossings, (N, L) matrix of the fraction of
+            each move at which the line is crossed, valid where crossed) tuple.
+        """
+        if not len(self.lines) or not len(prev):
+            empty = np.zeros((len(prev), len(self.lines)))
+            return empty.astype(bool), empty
+        ax, ay = self.origins
+        dx, dy = self.directions
+        p1x, p1y = prev[:, 0:1], prev[:, 1:2]
+        p2x, p2y = cur[:, 0:1], cur[:, 1:2]
+        val1 = dx * (p1y - ay) - dy * (p1x - ax)
+        val2 = dx * (p2y - ay) - dy * (p2x - ax)
+        crossed = val1 * val2 < 0
+        if self.any_bounded:
+            bx, by = self.ends
+            mx, my = p2x - p1x, p2y - p1y
+            side_a = mx * (ay - p1y) - my * (ax - p1x)
+            side_b = mx * (by - p1y) - my * (bx - p1x)
+            crossed &= ~self.bounded | (side_a * side_b <= 0)
+        # the signed distances to the line shrink linearly along the move
+        fraction = np.divide(val1, val1 - val2, out=np.zeros_like(val1), where=crossed)
+        return crossed, fraction
+
+    def contains(self, points: np.ndarray) -> np.ndarray:
+        """
+        Even-odd point-in-polygon test of N points against all P polygons at once.
+
+        Args:
+            points: (N, 2) track positions.
+
+        Returns:
+            (N, P) boolean matrix.
+        """
+        if not len(self.polygons) or not len(points):
+            return np.zeros((len(points), len(self.polygons)), dtype=bool)
+        xi, yi = self.polygons[..., 0], self.polygons[..., 1]                              # (P, V)
+        xj, yj = np.roll(xi, 1, axis=1), np.roll(yi, 1, axis=1)
+        x, y = points[:, 0, None, None], points[:, 1, None, None]                          # (N, 1, 1)
+        straddles = (yi > y) != (yj > y)                                                   # (N, P, V)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_cross = (xj - xi) * (y - yi) / (yj - yi) + xi
+        hits = straddles & (x < x_cross)
+        return np.count_nonzero(hits, axis=2) % 2 == 1